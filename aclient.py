@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Shared async access to the public Binance REST endpoints
+
+AsyncClient keeps one aiohttp session (a pooled, keep-alive connection per
+host, so TLS is negotiated once per connection rather than once per call),
+spends request weight from a token bucket that follows the
+X-MBX-USED-WEIGHT-1M header Binance returns, and coalesces concurrent
+identical requests into one. Public endpoints need no API key, so nothing
+reads credentials.txt.
+
+PublicClient runs one AsyncClient on a background event loop and offers the
+python-binance method names used by history.HistoryLoader and batch.py
+(get_klines, get_exchange_info), so existing threaded code can share it.
+shared_client() hands out one PublicClient per REST root.
+"""
+import asyncio
+import atexit
+import threading
+import time
+
+import aiohttp
+
+from profiling import count
+from ratelimit import WEIGHT_PER_MINUTE, kline_weight
+
+API_URL = 'https://api.binance.com'
+
+# Request weight of the endpoints used here
+WEIGHTS = {
+    '/api/v3/ping': 1,
+    '/api/v3/time': 1,
+    '/api/v3/exchangeInfo': 20,
+}
+
+# Statuses after which Binance wants us to back off: rate limited, IP banned
+BACKOFF_STATUS = {418, 429}
+
+
+class APIError(Exception):
+    """ Error response, with status_code like python-binance's BinanceAPIException so retry code works with both """
+
+    def __init__(self, status_code, code=None, message=''):
+        super().__init__(f'APIError(status={status_code}, code={code}): {message}')
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+
+
+class WeightLimiter:
+    """
+    asyncio token bucket refilled at weight_per_minute / 60 tokens a second.
+    Other processes on the same IP spend from the same server-side budget, so
+    every response's used-weight header caps the local tokens at what the
+    server says is left, and a 429/418 pauses all requests for Retry-After.
+    """
+
+    def __init__(self, weight_per_minute=WEIGHT_PER_MINUTE):
+        self.capacity = weight_per_minute
+        self.rate = weight_per_minute / 60.0
+        self.tokens = float(weight_per_minute)
+        self.updated = time.monotonic()
+        #monotonic time before which nothing is sent
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, weight=1):
+        """ Waits until weight tokens are available and takes them; callers are served in order """
+        async with self.lock:
+            while True:
+                self.refill()
+                wait = self.paused_until - self.updated
+                if wait <= 0 and self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                await asyncio.sleep(max(wait, (weight - self.tokens) / self.rate))
+
+    def observe(self, used):
+        """ The server has counted used weight in the current minute """
+        self.refill()
+        self.tokens = min(self.tokens, self.capacity - used)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class AsyncClient:
+
+    def __init__(self, api_url=API_URL, weight_per_minute=WEIGHT_PER_MINUTE, connections=16, timeout=30):
+        self.api_url = api_url.rstrip('/')
+        self.limiter = WeightLimiter(weight_per_minute)
+        self.connections = connections
+        self.timeout = timeout
+        self.session = None
+        #Request key -> task of the request in flight
+        self.pending = {}
+        #Requests sent and requests answered from another caller's request
+        self.sent = 0
+        self.coalesced = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def request(self, path, weight=None, **params):
+        """ GETs path, sharing the response with identical requests still in flight """
+        params = {key: value for key, value in params.items() if value is not None}
+        key = (path, tuple(sorted(params.items())))
+        task = self.pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.fetch(path, WEIGHTS.get(path, 1) if weight is None else weight, params))
+            self.pending[key] = task
+            task.add_done_callback(lambda _: self.pending.pop(key, None))
+        else:
+            self.coalesced += 1
+            count('api_coalesced')
+        #One caller giving up must not cancel the request for the others
+        return await asyncio.shield(task)
+
+    async def fetch(self, path, weight, params):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        await self.limiter.acquire(weight)
+        self.sent += 1
+        count('api_requests')
+        count('api_weight', weight)
+        async with self.session.get(self.api_url + path, params=params) as response:
+            used = response.headers.get('X-MBX-USED-WEIGHT-1M')
+            if used is not None:
+                self.limiter.observe(int(used))
+            if response.status in BACKOFF_STATUS:
+                self.limiter.pause(float(response.headers.get('Retry-After', 60)))
+            payload = await response.json(content_type=None)
+            if response.status >= 400:
+                raise APIError(response.status, payload.get('code'), payload.get('msg', ''))
+            return payload
+
+    async def ping(self):
+        return await self.request('/api/v3/ping')
+
+    async def server_time(self):
+        return (await self.request('/api/v3/time'))['serverTime']
+
+    async def exchange_info(self):
+        return await self.request('/api/v3/exchangeInfo')
+
+    async def klines(self, symbol, interval, start=None, end=None, limit=500):
+        """ Raw kline rows like python-binance's get_klines """
+        return await self.request('/api/v3/klines', kline_weight(limit), symbol=symbol.upper(), interval=interval,
+                                  startTime=start, endTime=end, limit=limit)
+
+
+class PublicClient:
+    """ Blocking, thread-safe facade over one AsyncClient running on its own event loop thread """
+
+    def __init__(self, api_url=API_URL, **options):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='aclient', daemon=True)
+        self.thread.start()
+        self.client = AsyncClient(api_url, **options)
+
+    def call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def ping(self):
+        return self.call(self.client.ping())
+
+    def get_server_time(self):
+        return {'serverTime': self.call(self.client.server_time())}
+
+    def get_exchange_info(self):
+        return self.call(self.client.exchange_info())
+
+    def get_klines(self, symbol, interval, startTime=None, endTime=None, limit=500):
+        return self.call(self.client.klines(symbol, interval, startTime, endTime, limit))
+
+    def close(self):
+        self.call(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+# REST root -> PublicClient
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(api_url=None, **options):
+    """ The process-wide PublicClient for api_url (default api.binance.com) """
+    api_url = (api_url or API_URL).rstrip('/')
+    with _clients_lock:
+        if api_url not in _clients:
+            _clients[api_url] = PublicClient(api_url, **options)
+        return _clients[api_url]
+
+
+@atexit.register
+def close_shared():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -2,31 +2,43 @@
 """
 TALIB Class
 """
-import threading
-from datetime import datetime
-
-import matplotlib.pyplot as plt
 import numpy as np
 import argparse
-import talib as ta
-import finplot as fplt
-from binance.client import Client
-import binance
-import pandas as pd
 
-from finplot import candlestick_ochl
-from matplotlib.dates import date2num
+from aclient import shared_client
+from history import HistoryLoader, parse_date
+from indicator_cache import IndicatorCache, default_cache
+from klines import Klines
+from klinestore import KlineStore
+from profiling import count, span, timed
+from registry import INDICATORS, compute
+from resample import BASE, resample_store, update_resampled
+from signals import BUY, crossover_signals
+
+# Indicator name -> TaGenerator method
+GENERATORS = {
+    'MACD': 'generate_macd',
+    'STOCH': 'generate_stoch',
+    'SAR': 'generate_sar',
+    'BBANDS': 'generate_bbands',
+    'SMA': 'generate_sma',
+    'RSI': 'generate_rsi',
+    'ALL': 'generate_all',
+}
 
 
 class Trader:
-    def __init__(self, file):
-        self.connect(file)
+    def __init__(self, file, api_url=None):
+        self.connect(file, api_url)
 
-    """ Creates Binance client """
-    def connect(self,file):
+    """ Creates Binance client, optionally against another REST root (e.g. mockapi.py) """
+    def connect(self,file, api_url=None):
+        from binance.client import Client
         lines = [line.rstrip('\n') for line in open(file)]
         key = lines[0]
         secret = lines[1]
+        if api_url:
+            Client.API_URL = api_url.rstrip('/') + '/api'
         self.client = Client(key, secret)
 
     """ Gets all account balances """
@@ -37,7 +49,8 @@ class Trader:
 
 class TaGenerator:
 
-    def __init__(self, trading_pair, interval):
+    def __init__(self, trading_pair, interval, store=None, offline=False, api_url=None, start=None, end=None,
+                 workers=4, headless=False, cache=None, resample=False, klines=None):
         self.rc_params = {
             "lines.color": "white",
             "patch.edgecolor": "white",
@@ -54,122 +67,137 @@ class TaGenerator:
         self.trading_pair = trading_pair
         self.interval = interval
         self.filename = 'credentials.txt'
-        self.trader = Trader(self.filename)
-        self.klines = self.trader.client.get_klines(symbol=trading_pair, interval=interval)
-        self.open_time = [int(entry[0]) for entry in self.klines]
-        self.low = [float(entry[1]) for entry in self.klines]
-        self.mid = [float(entry[2]) for entry in self.klines]
-        self.high = [float(entry[3]) for entry in self.klines]
-        self.close = [float(entry[4]) for entry in self.klines]
-        self.close_array = np.asarray(self.close)
-        self.high_array = np.asarray(self.high)
-        self.low_array = np.asarray(self.low)
-        self.new_time = [datetime.fromtimestamp(time / 1000) for time in self.open_time]
+        self.store = store if store is not None else KlineStore()
+        if klines is not None:
+            #Already loaded (service.py keeps them warm)
+            self.klines = klines
+        else:
+            if not offline:
+                #Klines are public: the pooled, unauthenticated client shared by every TaGenerator
+                loader = HistoryLoader(shared_client(api_url), workers=workers)
+                with span('fetch'):
+                    #With resample only 1m candles are fetched and the interval is built from them
+                    self.store.update(loader, trading_pair, BASE if resample else interval, start=start, end=end)
+            if resample and interval != BASE:
+                with span('resample'):
+                    resample_store(self.store, trading_pair, interval)
+            with span('load'):
+                self.klines = Klines.from_columns(self.store.load(trading_pair, interval, start=start, end=end))
+            count('candles_loaded', len(self.klines))
+        if not len(self.klines):
+            raise ValueError(f'No stored klines for {trading_pair} {interval}')
+        self.open_time = self.klines.open_time
+        self.close_array = self.klines.close
+        self.high_array = self.klines.high
+        self.low_array = self.klines.low
+        self.new_time = self.klines.time
+        self.cache = cache if cache is not None else default_cache
+        if headless:
+            #Own Figure on the Agg canvas, no pyplot state involved
+            from render import Chart
+            self.plt = Chart()
+        else:
+            import matplotlib.pyplot as plt
+            plt.rcParams.update(self.rc_params)
+            self.plt = plt
 
+    """ Outputs of a registry indicator, computed once per dataset through the cache """
+    def indicator(self, key):
+        values = compute(self.klines, [key], self.cache)
+        return tuple(values[ref] for ref in INDICATORS[key].refs())
 
+    @timed('generate_bbands')
     def generate_bbands(self, title='Boiler Bands'):
-        upperband, middleband, lowerband = ta.BBANDS(self.close_array, timeperiod=5, nbdevup=2, nbdevdn=2, matype=0)
-        #plt.rcParams.update(self.rc_params)
-        # plt.style.use('dark_background')
-        plt.plot(self.new_time, upperband, label='UPPERBAND Signal')
-        plt.plot(self.new_time, middleband, label='MIDDLEBAND Signal')
-        plt.plot(self.new_time, lowerband, label='LOWERBAND Histogram')
-        plt.title(f"{title} Plot for {self.trading_pair} Period: {self.interval}")
-        plt.xlabel("Open Time")
-        plt.ylabel("Price")
-        return plt
+        upperband, middleband, lowerband = self.indicator('BBANDS')
+        self.plt.plot(self.new_time, upperband, label='UPPERBAND Signal')
+        self.plt.plot(self.new_time, middleband, label='MIDDLEBAND Signal')
+        self.plt.plot(self.new_time, lowerband, label='LOWERBAND Histogram')
+        self.plt.title(f"{title} Plot for {self.trading_pair} Period: {self.interval}")
+        self.plt.xlabel("Open Time")
+        self.plt.ylabel("Price")
+        return self.plt
 
 
 
+    @timed('generate_stoch')
     def generate_stoch(self, title='Stochastic'):
-        slowk, slowd = ta.STOCH(self.low_array, self.high_array, self.close_array)
-        plt.rcParams.update(self.rc_params)
-        #plt.style.use('dark_background')
-        plt.plot(self.new_time, slowk, label='STOCH Slowk', color='blue')
-        plt.plot(self.new_time, slowd, label='STOCH Slowd', color='red')
-        plt.title(f"{title} Plot for {self.trading_pair} Period: {self.interval}")
-        plt.xlabel("Open Time")
-        plt.ylabel("Price")
-        return plt
+        slowk, slowd = self.indicator('STOCH')
+        self.plt.plot(self.new_time, slowk, label='STOCH Slowk', color='blue')
+        self.plt.plot(self.new_time, slowd, label='STOCH Slowd', color='red')
+        self.plt.title(f"{title} Plot for {self.trading_pair} Period: {self.interval}")
+        self.plt.xlabel("Open Time")
+        self.plt.ylabel("Price")
+        return self.plt
 
+    @timed('generate_macd')
     def generate_macd(self, title='MACD'):
-        macd, macdsignal, macdhist = ta.MACD(self.close_array, fastperiod=12, slowperiod=26, signalperiod=9)
-
-        crosses = []
-        macdabove = False
-        for i in range(len(macd)):
-            if np.isnan(macd[i]) or np.isnan(macdsignal[i]):
-                pass
-            else:
-                if macd[i] > macdsignal[i]:
-                    if macdabove == False:
-                        macdabove = True
-                        cross = [self.new_time[i], macd[i], 'go']
-                        crosses.append(cross)
-                else:
-                    if macdabove == True:
-                        macdabove = False
-                        cross = [self.new_time[i], macd[i], 'ro']
-                        crosses.append(cross)
-
-        plt.rcParams.update(self.rc_params)
-        plt.plot(self.new_time, macd, label='MACD')
-        plt.plot(self.new_time, macdsignal, label='MACD Signal')
-        for cross in crosses:
-            plt.plot(cross[0], cross[1], cross[2])
+        macd, macdsignal, macdhist = self.indicator('MACD')
+
+        signals = crossover_signals(macd, macdsignal)
+        crosses = np.flatnonzero(signals)
+
+        self.plt.plot(self.new_time, macd, label='MACD')
+        self.plt.plot(self.new_time, macdsignal, label='MACD Signal')
+        #Every cross in one call, green for BUY and red for SELL
+        self.plt.scatter(self.new_time[crosses], macd[crosses], c=np.where(signals[crosses] == BUY, 'g', 'r'), zorder=3)
         # plt.plot(new_time, macdhist, label='MACD Histogram')
-        plt.title(f"{title} Plot for {self.trading_pair} Period: {self.interval}")
-        plt.xlabel("Open Time")
-        plt.ylabel("Price")
-        return plt
+        self.plt.title(f"{title} Plot for {self.trading_pair} Period: {self.interval}")
+        self.plt.xlabel("Open Time")
+        self.plt.ylabel("Price")
+        return self.plt
 
+    @timed('generate_sar')
     def generate_sar(self, title='Parabolic SAR'):
-        SAR = ta.SAR(self.high_array, self.low_array, acceleration=0.05, maximum=0.2)
-        plt.rcParams.update(self.rc_params)
-        plt.plot(self.new_time, SAR, label='Parabolic SAR', marker='.', linestyle='dotted', color='green')
-        plt.title(f"{title} Plot for {self.trading_pair} Period: {self.interval}")
-        plt.xlabel("Open Time")
-        plt.ylabel("Price")
-        return plt
+        SAR, = self.indicator('SAR')
+        self.plt.plot(self.new_time, SAR, label='Parabolic SAR', marker='.', linestyle='dotted', color='green')
+        self.plt.title(f"{title} Plot for {self.trading_pair} Period: {self.interval}")
+        self.plt.xlabel("Open Time")
+        self.plt.ylabel("Price")
+        return self.plt
 
 
+    @timed('generate_sma')
     def generate_sma(self, title='Simple Moving Average'):
-        SMA_200 = ta.SMA(self.close_array, timeperiod=200)
-        SMA_14 = ta.SMA(self.close_array, timeperiod=14)
-        plt.rcParams.update(self.rc_params)
-        plt.title(f"{title} Plot for {self.trading_pair} Period: {self.interval}")
-        plt.plot(self.new_time, SMA_200, label='SMA 200', color='red')
-        plt.plot(self.new_time, SMA_14, label='SMA 14', color='blue')
-        return plt
+        SMA_200, = self.indicator('SMA_200')
+        SMA_14, = self.indicator('SMA_14')
+        self.plt.title(f"{title} Plot for {self.trading_pair} Period: {self.interval}")
+        self.plt.plot(self.new_time, SMA_200, label='SMA 200', color='red')
+        self.plt.plot(self.new_time, SMA_14, label='SMA 14', color='blue')
+        return self.plt
 
+    @timed('generate_rsi')
     def generate_rsi(self, title='Relative Strength Index'):
-        rsi = ta.RSI(self.close_array, timeperiod=14)
-        plt.rcParams.update(self.rc_params)
-        plt.title(f"{title} Plot for {self.trading_pair} Period: {self.interval}")
+        rsi, = self.indicator('RSI')
+        self.plt.title(f"{title} Plot for {self.trading_pair} Period: {self.interval}")
 
-        plt.plot(self.new_time, rsi, label='Relative Strength Index', color='red')
-        return plt
+        self.plt.plot(self.new_time, rsi, label='Relative Strength Index', color='red')
+        return self.plt
 
+    @timed('generate_all')
     def generate_all(self):
-        plt = self.generate_macd()
-        plt = self.generate_stoch()
-        plt = self.generate_sar()
-        plt = self.generate_bbands()
-        plt = self.generate_sma()
-        plt = self.generate_rsi(title=f'Multi-Indicator Plot Period {self.interval} ')
-        return plt
+        self.generate_macd()
+        self.generate_stoch()
+        self.generate_sar()
+        self.generate_bbands()
+        self.generate_sma()
+        return self.generate_rsi(title=f'Multi-Indicator Plot Period {self.interval} ')
 
 
 
 
-    def show(self, plt):
+    def save(self, plt, filename=None):
         plt.xlabel("Time")
         plt.ylabel("Price")
         plt.grid()
         plt.legend()
-        plt.savefig(f'{self.trading_pair}_{self.interval}.png')
+        with span('savefig'):
+            plt.savefig(filename or f'{self.trading_pair}_{self.interval}.png')
+
+    def show(self, plt):
+        self.save(plt)
         if not args.no_plot:
-            plt.show()
+            with span('show'):
+                plt.show()
 
 
 if __name__ == '__main__':  # TODO: change dest from 'pair' to symbol, and 'interval' to 'period'
@@ -178,32 +206,157 @@ if __name__ == '__main__':  # TODO: change dest from 'pair' to symbol, and 'inte
     parser.add_argument('-i', '--indicator', default='MACD', type=str,
                         help='Plot this indicator (MACD, STOCH, SAR ,BBAND)')
     parser.add_argument('-p', '--period', dest='interval', default='1d', type=str, help='Interval. 1d means 1 day. 1h means 1 hour.')
-    """parser.add_argument('-a', '--auto', action='store_true',
-                        help="Run auto interval plot: '1d', '4h', '1h', '30m', '15m', '5m', '1m' ")"""
+    parser.add_argument('-a', '--auto', action='store_true',
+                        help="Batch over every interval: '1d', '4h', '1h', '30m', '15m', '5m', '1m' ")
     parser.add_argument('-np', '--no_plot', action='store_true', default=False, help='Generate Only, do not show.')
+    parser.add_argument('--store', default='klines', type=str, help='Directory of the local kline store')
+    parser.add_argument('--offline', action='store_true', default=False, help='Use stored klines only, no API calls')
+    parser.add_argument('--api-url', dest='api_url', default=None, type=str,
+                        help='Binance REST root to use instead of api.binance.com (e.g. a local mockapi.py)')
+    parser.add_argument('--start', default=None, type=str, help='First candle to load (ISO date or epoch ms)')
+    parser.add_argument('--end', default=None, type=str, help='Last candle to load (ISO date or epoch ms)')
+    parser.add_argument('--workers', default=4, type=int, help='Concurrent page downloads for --start/--end')
+    parser.add_argument('--cache-dir', dest='cache_dir', default=None, type=str,
+                        help='Keep computed indicators in this directory between runs')
+    parser.add_argument('--resample', action='store_true', default=False,
+                        help='Fetch only 1m candles and build the other intervals from them')
+    batch = parser.add_argument_group('batch', 'Headless charts for many symbols and intervals in one run')
+    batch.add_argument('--batch', action='store_true', default=False, help='Run in batch mode')
+    batch.add_argument('--symbols', nargs='+', default=None,
+                       help='Symbols to chart; a quote asset such as USDT means every pair quoted in it')
+    batch.add_argument('--intervals', nargs='+', default=None, help='Intervals to chart (default: --period)')
+    batch.add_argument('--indicators', nargs='+', default=None, help='Indicators to chart (default: --indicator)')
+    batch.add_argument('--outdir', default='charts', type=str, help='Directory the charts are written to')
+    batch.add_argument('--fetchers', default=8, type=int, help='Symbol/interval pairs fetched concurrently')
+    batch.add_argument('--weight', default=1200, type=int, help='API request weight budget per minute')
+    batch.add_argument('--processes', default=None, type=int, help='Chart rendering processes (default: all cores)')
+    live = parser.add_argument_group('live', 'Incremental indicators and signals on every closed candle')
+    live.add_argument('--live', action='store_true', default=False,
+                      help='Follow the kline websocket for --symbols/--intervals (default: --symbol/--period)')
+    live.add_argument('--replay', action='store_true', default=False,
+                      help='Replay the kline store from --start instead of connecting to the websocket')
+    live.add_argument('--ticks', default=0, type=int, help='Unclosed updates replayed before each candle')
+    scanner = parser.add_argument_group('scan', 'Rank many symbols by their latest indicator and signal state')
+    scanner.add_argument('--scan', action='store_true', default=False,
+                         help='Scan --symbols (default: every USDT pair) at --period')
+    scanner.add_argument('--bars', default=500, type=int, help='Candles per symbol to compute the indicators on')
+    scanner.add_argument('--rank', default='MACD_CROSS', type=str,
+                         help="Strategy column (freshest BUY first, e.g. RSI_7030) or value column (lowest "
+                              "first, e.g. RSI.rsi) to rank by")
+    scanner.add_argument('--top', default=20, type=int, help='Rows of the ranking to print')
+    scanner.add_argument('--threads', default=None, type=int, help='Threads for the TA-Lib indicators')
+    scanner.add_argument('--stale', action='store_true', default=False,
+                         help='Also rank symbols without a candle at the latest bar (delisted or halted)')
+    parser.add_argument('--profile', action='store_true', default=False,
+                        help='Print a per-stage timing breakdown and counters at exit')
+    parser.add_argument('--profile-out', dest='profile_out', default=None, type=str,
+                        help='With --profile, also write a cProfile dump here and folded span stacks to <path>.folded')
+    serving = parser.add_argument_group('serve', 'Long-running HTTP/JSON analysis API over warm data')
+    serving.add_argument('--serve', action='store_true', default=False,
+                         help='Serve indicators, signals, backtests and charts (see service.py)')
+    serving.add_argument('--host', default='127.0.0.1', type=str, help='Address to listen on')
+    serving.add_argument('--port', default=8080, type=int, help='Port to listen on')
+    serving.add_argument('--refresh', default=10.0, type=float,
+                         help='Seconds before a symbol/interval is topped up from the API again')
     args = parser.parse_args()
+    if args.profile or args.profile_out:
+        import profiling
+        profiling.enable(args.profile_out)
+    if args.serve:
+        from service import Service, serve
+
+        loader = None if args.offline else HistoryLoader(shared_client(args.api_url), workers=args.workers)
+        service = Service(KlineStore(args.store), loader, cache=IndicatorCache(directory=args.cache_dir),
+                          refresh=args.refresh, resample=args.resample)
+        if args.symbols:
+            service.warm([(symbol, interval) for symbol in args.symbols for interval in args.intervals or [args.interval]])
+        server = serve(service, args.host, args.port)
+        print(f'Serving analysis API on http://{args.host}:{server.server_port}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
+        exit(0)
+    if args.scan:
+        from batch import Timings, fetch_all, resolve_symbols
+        from ratelimit import RateLimiter
+        from scanner import rank, scan, stored_symbols
+
+        store = KlineStore(args.store)
+        symbols = args.symbols or ['USDT']
+        if args.offline:
+            symbols = stored_symbols(store, symbols, args.interval)
+        else:
+            client = shared_client(args.api_url)
+            symbols = resolve_symbols(client, symbols)
+            loader = HistoryLoader(client, workers=2, limiter=RateLimiter(args.weight))
+            fetched = BASE if args.resample else args.interval
+            failed = fetch_all(store, loader, [(symbol, fetched) for symbol in symbols], args.fetchers, Timings(),
+                               end=parse_date(args.end))
+            symbols = [symbol for symbol in symbols if (symbol, fetched) not in failed]
+        if args.resample and args.interval != BASE:
+            for symbol in symbols:
+                resample_store(store, symbol, args.interval)
+        table = scan(store, symbols, args.interval, bars=args.bars, end=parse_date(args.end), threads=args.threads)
+        print(f'{len(table)} symbols at {np.datetime64(table.attrs["time"], "ms")}')
+        stale = int((table['stale_bars'] > 0).sum())
+        if stale and not args.stale:
+            print(f'{stale} symbols without a candle at that time left out, see --stale')
+        print(rank(table, args.rank, args.stale).head(args.top).to_string(index=False))
+        exit(0)
+    if args.live or args.replay:
+        from streaming import LiveStream, Monitor, ReplayStream, Resampling
+
+        def report(result):
+            when = np.datetime64(result['open_time'], 'ms')
+            for indicator, side in result['signals']:
+                print(f"{when} {result['symbol']} {result['interval']} {indicator} "
+                      f"{'BUY' if side > 0 else 'SELL'} at {result['close']}")
+
+        store = KlineStore(args.store)
+        start = parse_date(args.start)
+        pairs = [(symbol, interval) for symbol in args.symbols or [args.pair]
+                 for interval in args.intervals or [args.interval]]
+        loader = None if args.offline else HistoryLoader(shared_client(args.api_url), workers=args.workers)
+        if args.resample:
+            for symbol in args.symbols or [args.pair]:
+                update_resampled(store, loader, symbol.upper(), args.intervals or [args.interval])
+        elif loader:
+            for symbol, interval in pairs:
+                store.update(loader, symbol, interval)
+        monitor = Monitor(pairs, report)
+        monitor.warm_up(store, end=None if start is None else start - 1)
+        streams, on_message = pairs, monitor.on_message
+        if args.resample:
+            #One 1m stream per symbol, the intervals are built from it
+            feed = Resampling(pairs, monitor.on_message)
+            feed.seed(store, end=None if start is None else start - 1)
+            streams, on_message = feed.streams(), feed.on_message
+        if args.replay:
+            ReplayStream(store, streams, start=start, end=parse_date(args.end), ticks=args.ticks).run(on_message)
+        else:
+            LiveStream(streams).run(on_message)
+        exit(0)
+    if args.batch or args.auto:
+        from batch import AUTO_INTERVALS, run_batch
+        client = None if args.offline else shared_client(args.api_url)
+        intervals = AUTO_INTERVALS if args.auto else args.intervals or [args.interval]
+        run_batch(client, KlineStore(args.store), args.symbols or [args.pair], intervals,
+                  args.indicators or [args.indicator], outdir=args.outdir, workers=args.fetchers,
+                  weight_per_minute=args.weight, start=parse_date(args.start), end=parse_date(args.end),
+                  offline=args.offline, processes=args.processes, resample=args.resample)
+        exit(0)
     try:
-        tagen = TaGenerator(trading_pair=args.pair, interval=args.interval)
+        tagen = TaGenerator(trading_pair=args.pair, interval=args.interval, store=KlineStore(args.store),
+                            offline=args.offline, api_url=args.api_url, start=parse_date(args.start),
+                            end=parse_date(args.end), workers=args.workers, headless=args.no_plot,
+                            cache=IndicatorCache(directory=args.cache_dir) if args.cache_dir else None,
+                            resample=args.resample)
     except Exception as fuck:
         print(f'Error: {fuck}')
 
     else:
-        if args.interval:
-            if args.indicator == 'MACD':
-                p = tagen.generate_macd()
-            elif args.indicator == 'STOCH':
-                p = tagen.generate_stoch()
-            elif args.indicator == 'SAR':
-                p = tagen.generate_sar()
-            elif args.indicator == 'BBANDS':
-                p = tagen.generate_bbands()
-            elif args.indicator == 'SMA':
-                p = tagen.generate_sma()
-            elif args.indicator == 'RSI':
-                p = tagen.generate_rsi()
-            elif args.indicator == 'ALL':
-                p = tagen.generate_all()
-            else:
-                print('Invalid Interval Given!')
-                exit(1)
-            tagen.show(plt=p)
+        if args.indicator not in GENERATORS:
+            print(f'Invalid Indicator Given! Choose from {", ".join(GENERATORS)}')
+            exit(1)
+        tagen.show(plt=getattr(tagen, GENERATORS[args.indicator])())
@@ -1,152 +1,73 @@
 #!/usr/bin/env python3
 import argparse
 
-from binance.client import Client
-import talib as ta
 import matplotlib.pyplot as plt
 import numpy as np
-from datetime import datetime
 
-class Trader:
-    def __init__(self, file):
-        self.connect(file)
-
-    """ Creates Binance client """
-    def connect(self,file):
-        lines = [line.rstrip('\n') for line in open(file)]
-        key = lines[0]
-        secret = lines[1]
-        self.client = Client(key, secret)
-
-    """ Gets all account balances """
-    def getBalances(self):
-        prices = self.client.get_withdraw_history()
-        return prices
+from aclient import shared_client
+from chunked import ChunkedBacktest, chunks, signal_chunks
+from history import HistoryLoader, parse_date
+from engine import TRADE_DTYPE, Costs, run_backtest
+from indicator_cache import default_cache
+from klines import Klines
+from klinestore import KlineStore, periods_per_year
+from profiling import count, span, timed
+from registry import INDICATORS, STRATEGIES, compute, default_strategy, families, get_strategy
+from resample import update_resampled
+from results import Side, fill_records, signal_records, trade_table, write_records
+from signals import BUY, SELL
+from sweep import COLUMNS as SWEEP_COLUMNS, parse_range, run_sweep, write_results
+from walkforward import METRICS, chained_percent, configs, run_walkforward
 
 class Strategy:
 
-    def __init__(self, indicator_name, strategy_name, pair, interval, klines):
+    def __init__(self, indicator_name, strategy_name, pair, interval, klines, cache=None):
         #Name of indicator
         self.indicator = indicator_name
         #Name of strategy being used
         self.strategy = strategy_name
+        #registry.Rule behind the strategy
+        self.rule = get_strategy(indicator_name, strategy_name)
         #Trading pair
         self.pair = pair
         #Trading interval
         self.interval = interval
-        #Kline data for the pair on given interval
+        #Kline data for the pair on given interval (a klines.Klines container)
         self.klines = klines
+        #int8 BUY/SELL signal per kline
+        self.signals = None
+        #Open times as datetime64[ms]
+        self.time = klines.time
+        #indicator_cache.IndicatorCache the indicators are computed through
+        self.cache = cache if cache is not None else default_cache
         #Calculates the indicator
         self.indicator_result = self.calculateIndicator()
-        #Uses the indicator to run strategy
+        #Uses the indicator to run strategy, a results.SIGNAL_DTYPE record per signal
         self.strategy_result = self.calculateStrategy()
 
 
     '''
-    Calculates the desired indicator given the init parameters
+    Calculates every indicator the strategy requires, as {'KEY.output': array}
     '''
+    @timed('calculateIndicator')
     def calculateIndicator(self):
-        if self.indicator == 'MACD':
-            close = [float(entry[4]) for entry in self.klines]
-            close_array = np.asarray(close)
-
-            macd, macdsignal, macdhist = ta.MACD(close_array, fastperiod=12, slowperiod=26, signalperiod=9)
-            return [macd, macdsignal, macdhist]
-        elif self.indicator == 'RSI':
-            close = [float(entry[4]) for entry in self.klines]
-            close_array = np.asarray(close)
-
-            rsi = ta.RSI(close_array, timeperiod=14)
-            return rsi
-
-        else:
-            return None
+        return compute(self.klines, self.rule.requires, self.cache)
 
 
     '''
     Runs the desired strategy given the indicator results
     '''
+    @timed('calculateStrategy')
     def calculateStrategy(self):
-        if self.indicator == 'MACD':
+        self.signals = self.rule.signals(self.indicator_result)
+        return signal_records(self.signals, self.klines.open_time, self.indicator_result[self.rule.value],
+                              self.klines.close)
 
-            if self.strategy == 'CROSS':
-                open_time = [int(entry[0]) for entry in self.klines]
-                new_time = [datetime.fromtimestamp(time / 1000) for time in open_time]
-                self.time = new_time
-                crosses = []
-                macdabove = False
-                #Runs through each timestamp in order
-                for i in range(len(self.indicator_result[0])):
-                    if np.isnan(self.indicator_result[0][i]) or np.isnan(self.indicator_result[1][i]):
-                        pass
-                    #If both the MACD and signal are well defined, we compare the 2 and decide if a cross has occured
-                    else:
-                        if self.indicator_result[0][i] > self.indicator_result[1][i]:
-                            if macdabove == False:
-                                macdabove = True
-                                #Appends the timestamp, MACD value at the timestamp, color of dot, buy signal, and the buy price
-                                cross = [new_time[i],self.indicator_result[0][i] , 'go', 'BUY', self.klines[i][4]]
-                                crosses.append(cross)
-                        else:
-                            if macdabove == True:
-                                macdabove = False
-                                #Appends the timestamp, MACD value at the timestamp, color of dot, sell signal, and the sell price
-                                cross = [new_time[i], self.indicator_result[0][i], 'ro', 'SELL', self.klines[i][4]]
-                                crosses.append(cross)
-                return crosses
-
-            else:
-                return None
-        elif self.indicator == 'RSI':
-            if self.strategy == '7030':
-                open_time = [int(entry[0]) for entry in self.klines]
-                new_time = [datetime.fromtimestamp(time / 1000) for time in open_time]
-                self.time = new_time
-                result = []
-                active_buy = False
-                # Runs through each timestamp in order
-                for i in range(len(self.indicator_result)):
-                    if np.isnan(self.indicator_result[i]):
-                        pass
-                    # If the RSI is well defined, check if over 70 or under 30
-                    else:
-                        if float(self.indicator_result[i]) < 30 and active_buy == False:
-                            # Appends the timestamp, RSI value at the timestamp, color of dot, buy signal, and the buy price
-                            entry = [new_time[i], self.indicator_result[i], 'go', 'BUY', self.klines[i][4]]
-                            result.append(entry)
-                            active_buy = True
-                        elif float(self.indicator_result[i]) > 70 and active_buy == True:
-                            # Appends the timestamp, RSI value at the timestamp, color of dot, sell signal, and the sell price
-                            entry = [new_time[i], self.indicator_result[i], 'ro', 'SELL', self.klines[i][4]]
-                            result.append(entry)
-                            active_buy = False
-                return result
-            elif self.strategy == '8020':
-                open_time = [int(entry[0]) for entry in self.klines]
-                new_time = [datetime.fromtimestamp(time / 1000) for time in open_time]
-                self.time = new_time
-                result = []
-                active_buy = False
-                # Runs through each timestamp in order
-                for i in range(len(self.indicator_result)):
-                    if np.isnan(self.indicator_result[i]):
-                        pass
-                    # If the RSI is well defined, check if over 80 or under 20
-                    else:
-                        if float(self.indicator_result[i]) < 20 and active_buy == False:
-                            # Appends the timestamp, RSI value at the timestamp, color of dot, buy signal, and the buy price
-                            entry = [new_time[i], self.indicator_result[i], 'go', 'BUY', self.klines[i][4]]
-                            result.append(entry)
-                            active_buy = True
-                        elif float(self.indicator_result[i]) > 80 and active_buy == True:
-                            # Appends the timestamp, RSI value at the timestamp, color of dot, sell signal, and the sell price
-                            entry = [new_time[i], self.indicator_result[i], 'ro', 'SELL', self.klines[i][4]]
-                            result.append(entry)
-                            active_buy = False
-                return result
-
-        else:
-            return None
+    '''
+    Getter for the int8 signal array
+    '''
+    def getSignals(self):
+        return self.signals
 
     '''
     Getter for the strategy result
@@ -182,43 +103,34 @@ class Strategy:
     Plots the desired indicator with strategy buy and sell points
     '''
     def plotIndicator(self):
-        open_time = [int(entry[0]) for entry in klines]
-        new_time = [datetime.fromtimestamp(time / 1000) for time in open_time]
+        new_time = self.time
         plt.style.use('dark_background')
-        for entry in self.strategy_result:
-            plt.plot(entry[0], entry[1], entry[2])
-        if self.indicator == 'MACD':
-            plt.plot(new_time, self.indicator_result[0], label=f'{self.strategy}')
-            plt.plot(new_time, self.indicator_result[1], label=f'{self.strategy} Signal')
-            plt.plot(new_time, self.indicator_result[2], label=f'{self.strategy} Histogram')
-
-        elif self.indicator == 'RSI':
-            plt.plot(new_time, self.indicator_result, label='RSI')
-
-        else:
-            pass
+        signals = self.strategy_result
+        for side, style in ((BUY, 'go'), (SELL, 'ro')):
+            chosen = signals[signals['side'] == side]
+            plt.plot(chosen['open_time'].view('datetime64[ms]'), chosen['value'], style)
+        for key in self.rule.requires:
+            indicator = INDICATORS[key]
+            for ref, label in zip(indicator.refs(), indicator.labels):
+                plt.plot(new_time, self.indicator_result[ref], label=label)
 
         title = self.indicator + " Plot for " + self.pair + " on " + self.interval
         plt.title(title)
         plt.xlabel("Open Time")
         plt.ylabel("Value")
         plt.legend()
-        plt.show()
+        with span('show'):
+            plt.show()
 
 
 class Backtest:
-    def __init__(self, starting_amount, start_datetime, end_datetime, strategy):
+    def __init__(self, starting_amount, start_datetime, end_datetime, strategy, costs=None, size=1.0,
+                 stop_loss=None, take_profit=None):
         #Starting amount
         self.start = starting_amount
-        #Number of trades
-        self.num_trades = 0
-        #Number of profitable trades
-        self.profitable_trades = 0
-        #Running amount
-        self.amount = self.start
-        #Start of desired interval
+        #Start of desired interval (exclusive)
         self.startTime = start_datetime
-        #End of desired interval
+        #End of desired interval (exclusive)
         self.endTime = end_datetime
         #Strategy object
         self.strategy = strategy
@@ -226,47 +138,36 @@ class Backtest:
         self.pair = self.strategy.getPair()
         #Trading interval
         self.interval = self.strategy.getInterval()
-        #Outputs the trades exectued
-        self.trades = []
-        #Runs the backtest
+        #engine.Costs of every fill (fees and slippage), none by default
+        self.costs = costs
+        #Fraction of the cash committed to each entry
+        self.size = size
+        #Stop-loss/take-profit distances from the entry price, as fractions
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        #Runs the backtest, an engine.BacktestResult
         self.results = self.runBacktest()
-        #Prints the results
-        self.printResults()
+        #Ending amount
+        self.amount = self.results.amount
+        #Number of trades
+        self.num_trades = self.results.num_trades
+        #Number of profitable trades
+        self.profitable_trades = self.results.profitable_trades
+        #Outputs the trades exectued, a results.FILL_DTYPE record per fill
+        self.trades = fill_records(self.results, self.strategy.getKlines().open_time)
 
 
+    @timed('runBacktest')
     def runBacktest(self):
-        amount = self.start
-        klines = self.strategy.getKlines()
         time = self.strategy.getTime()
-        point_finder = 0
-        strategy_result = self.strategy.getStrategyResult()
-        #Finds the first cross point within the desired backtest interval
-        while strategy_result[point_finder][0] < self.startTime:
-            point_finder += 1
-        #Initialize to not buy
-        active_buy = False
-        buy_price = 0
-        #Runs through each kline
-        for i in range(len(klines)):
-            if point_finder > len(strategy_result)-1:
-                break
-            #If timestamp is in the interval, check if strategy has triggered a buy or sell
-            if time[i] > self.startTime and time[i] < self.endTime:
-                if(time[i] == strategy_result[point_finder][0]):
-                    if strategy_result[point_finder][3] == 'BUY':
-                        active_buy = True
-                        buy_price = float(strategy_result[point_finder][4])
-                        self.trades.append(['BUY', buy_price])
-                    if strategy_result[point_finder][3] == 'SELL' and active_buy == True:
-                        active_buy = False
-                        bought_amount = amount / buy_price
-                        self.num_trades += 1
-                        if(float(strategy_result[point_finder][4]) > buy_price):
-                            self.profitable_trades += 1
-                        amount = bought_amount * float(strategy_result[point_finder][4])
-                        self.trades.append(['SELL', float(strategy_result[point_finder][4])])
-                    point_finder += 1
-        self.amount = amount
+        #Bars strictly between the start and end of the desired interval
+        first = np.searchsorted(time, np.datetime64(self.startTime, 'ms'), side='right')
+        stop = np.searchsorted(time, np.datetime64(self.endTime, 'ms'), side='left')
+        klines = self.strategy.getKlines()
+        return run_backtest(self.strategy.getSignals(), klines.close, self.start, first, stop, high=klines.high,
+                            low=klines.low, open_=klines.open, costs=self.costs, size=self.size,
+                            stop_loss=self.stop_loss, take_profit=self.take_profit,
+                            periods_per_year=periods_per_year(self.interval))
 
     '''
     Prints the results of the backtest
@@ -276,45 +177,185 @@ class Backtest:
         print("Interval: " + self.interval)
         print("Ending amount: " + str(self.amount))
         print("Number of Trades: " + str(self.num_trades))
-        profitable = self.profitable_trades / self.num_trades * 100
-        print("Percentage of Profitable Trades: " + str(profitable) + "%")
-        percent = self.amount / self.start * 100
-        print(str(percent) + "% of starting amount")
-        for entry in self.trades:
-            print(entry[0] + " at " + str(entry[1]))
+        print("Percentage of Profitable Trades: " + str(self.results.win_rate) + "%")
+        print(str(self.results.percent) + "% of starting amount")
+        print("Fees paid: " + str(self.results.fees))
+        print("Max drawdown: " + str(self.results.max_drawdown) + "%")
+        print("Sharpe ratio: " + str(self.results.sharpe))
+        print("Exposure: " + str(self.results.exposure) + "% of bars")
+        for side, price in zip(self.trades['side'].tolist(), self.trades['price'].tolist()):
+            print(Side(side).name + " at " + str(price))
 
 
 def main():
-    global klines
-    filename = 'credentials.txt'
-    trader = Trader(filename)
     parser = argparse.ArgumentParser()
     parser.add_argument('-p', '--pair', default='BTCUSDT', type=str, help='Instrument to analyse')
     parser.add_argument('-i', '--interval', default='1d', type=str, help='Interval. 1d means 1 day. 1h means 1 hour.')
-    parser.add_argument('-I', '--indicator', default='MACD', choices=['RSI', 'MACD'], type=str, help='Indictator to use')
-    parser.add_argument('-s', '--strategy', default='CROSS', type=str, choices=['7030', '8020', 'CROSS'])
+    parser.add_argument('-I', '--indicator', default='MACD', choices=families(), type=str,
+                        help='Indictator to use')
+    parser.add_argument('-s', '--strategy', default='CROSS', type=str,
+                        choices=sorted({name for _, name in STRATEGIES}))
+    parser.add_argument('--store', default='klines', type=str, help='Directory of the local kline store')
+    parser.add_argument('--offline', action='store_true', default=False, help='Use stored klines only, no API calls')
+    parser.add_argument('--api-url', dest='api_url', default=None, type=str,
+                        help='Binance REST root to use instead of api.binance.com (e.g. a local mockapi.py)')
+    parser.add_argument('--start', default=None, type=str, help='First candle to load (ISO date or epoch ms)')
+    parser.add_argument('--end', default=None, type=str, help='Last candle to load (ISO date or epoch ms)')
+    parser.add_argument('--workers', default=4, type=int, help='Concurrent page downloads for --start/--end')
+    parser.add_argument('--resample', action='store_true', default=False,
+                        help='Fetch only 1m candles and build the other intervals from them')
+    costs = parser.add_argument_group('costs', 'Fees, slippage, position size and stops, in percent')
+    costs.add_argument('--fee', default=0.1, type=float, help='Taker fee of market fills (default: Binance spot)')
+    costs.add_argument('--maker-fee', dest='maker_fee', default=0.1, type=float, help='Maker fee of take-profit fills')
+    costs.add_argument('--slippage', default=0.0, type=float,
+                       help='Slippage of market fills, of the price or of the bar range (see --slippage-model)')
+    costs.add_argument('--slippage-model', dest='slippage_model', default='fixed', choices=['fixed', 'range'])
+    costs.add_argument('--size', default=100.0, type=float, help='Share of the cash committed to each entry')
+    costs.add_argument('--stop-loss', dest='stop_loss', default=None, type=float, help='Stop-loss below the entry')
+    costs.add_argument('--take-profit', dest='take_profit', default=None, type=float,
+                       help='Take-profit above the entry')
+    parser.add_argument('--signals-out', dest='signals_out', default=None, type=str,
+                        help='Write the signals to this .csv, .parquet or .arrow file')
+    parser.add_argument('--trades-out', dest='trades_out', default=None, type=str,
+                        help='Write the closed trades to this .csv, .parquet or .arrow file')
+    sweep = parser.add_argument_group('sweep', 'Grid search over parameter ranges. Ranges are a value, a comma '
+                                               'separated list, or start:stop:step (inclusive)')
+    sweep.add_argument('--sweep', action='store_true', default=False, help='Run a parameter sweep instead')
+    sweep.add_argument('--symbols', nargs='+', default=None, help='Symbols to sweep (default: --pair)')
+    sweep.add_argument('--intervals', nargs='+', default=None, help='Intervals to sweep (default: --interval)')
+    sweep.add_argument('--indicators', nargs='+', default=['MACD', 'RSI'], choices=families(),
+                       help='MACD and RSI sweep the ranges below, other families their registered strategies')
+    sweep.add_argument('--fast', default='12', type=parse_range, help='MACD fast periods')
+    sweep.add_argument('--slow', default='26', type=parse_range, help='MACD slow periods')
+    sweep.add_argument('--signal', default='9', type=parse_range, help='MACD signal periods')
+    sweep.add_argument('--rsi-period', dest='rsi_period', default='14', type=parse_range, help='RSI periods')
+    sweep.add_argument('--lower', default='20,30', type=parse_range, help='RSI lower (buy) thresholds')
+    sweep.add_argument('--upper', default='70,80', type=parse_range, help='RSI upper (sell) thresholds')
+    sweep.add_argument('--processes', default=None, type=int, help='Worker processes (default: all cores)')
+    sweep.add_argument('-o', '--output', default=None, type=str,
+                       help='Results, .csv or .parquet (default: sweep.csv or walkforward.csv)')
+    parser.add_argument('--chunk', default=None, type=int,
+                        help='Stream the stored klines in chunks of this many candles, in bounded memory')
+    walk = parser.add_argument_group('walk-forward', 'Rolling train/test windows over the --start/--end range: '
+                                                     'the best strategy of -I and indicator parameters (from '
+                                                     'the sweep ranges) of each train slice are backtested on '
+                                                     'the test slice that follows')
+    walk.add_argument('--walk-forward', dest='walk_forward', action='store_true', default=False,
+                      help='Run a walk-forward backtest of -I instead')
+    walk.add_argument('--train', default=1000, type=int, help='Candles per train slice')
+    walk.add_argument('--test', default=250, type=int, help='Candles per test slice')
+    walk.add_argument('--step', default=None, type=int, help='Candles between window starts (default: --test)')
+    walk.add_argument('--metric', default='amount', choices=METRICS, help='What the train slice is ranked by')
+    parser.add_argument('--profile', action='store_true', default=False,
+                        help='Print a per-stage timing breakdown and counters at exit')
+    parser.add_argument('--profile-out', dest='profile_out', default=None, type=str,
+                        help='With --profile, also write a cProfile dump here and folded span stacks to <path>.folded')
     args = parser.parse_args()
+    if args.profile or args.profile_out:
+        import profiling
+        profiling.enable(args.profile_out)
     trading_pair = args.pair
     interval = args.interval
     strat = args.strategy
-    klines = trader.client.get_klines(symbol=trading_pair, interval=interval)
-    if args.indicator == 'RSI':
-        if args.strategy == 'CROSS':
-            strat = '8020'
-        else:
-            strat = args.strategy
-        rsi_strategy = Strategy('RSI', strat, trading_pair, interval, klines)
-        rsi_strategy.plotIndicator()
-        time = rsi_strategy.getTime()
-        Backtest(100000, time[0], time[len(time) - 1], rsi_strategy)
-    elif args.indicator == 'MACD':
-        strat = 'CROSS'
-        macd_strategy = Strategy('MACD', strat, trading_pair, interval, klines)
-        macd_strategy.plotIndicator()
-        time = macd_strategy.getTime()
-        Backtest(100000, time[0], time[len(time) - 1], macd_strategy)
-    else:
-
-        print(f'Unknown strategy {args.strategy}')
+    start = parse_date(args.start)
+    end = parse_date(args.end)
+    store = KlineStore(args.store)
+    fees = Costs(taker=args.fee / 100, maker=args.maker_fee / 100, slippage=args.slippage / 100,
+                 model=args.slippage_model)
+    size = args.size / 100
+    stop_loss = args.stop_loss / 100 if args.stop_loss else None
+    take_profit = args.take_profit / 100 if args.take_profit else None
+    loader = None
+    if not args.offline:
+        loader = HistoryLoader(shared_client(args.api_url), workers=args.workers)
+    if args.sweep:
+        #Every dataset is loaded once here and shared with the sweep workers
+        datasets = {}
+        for symbol in args.symbols or [trading_pair]:
+            if args.resample:
+                update_resampled(store, loader, symbol, args.intervals or [interval], start, end)
+            for period in args.intervals or [interval]:
+                if loader and not args.resample:
+                    store.update(loader, symbol, period, start=start, end=end)
+                columns = store.load(symbol, period, start=start, end=end, names=SWEEP_COLUMNS)
+                if not len(columns['close']):
+                    print(f'No stored klines for {symbol} {period}')
+                    continue
+                datasets[(symbol, period)] = columns
+        if stop_loss or take_profit:
+            print('Warning: --stop-loss/--take-profit are not applied in sweep mode')
+        table = run_sweep(datasets, args.indicators, args.fast, args.slow, args.signal, args.rsi_period,
+                          args.lower, args.upper, processes=args.processes, costs=fees, size=size)
+        write_results(table, args.output or 'sweep.csv')
+        print(table.head(20).to_string(index=False))
+        return True
+    if args.resample:
+        with span('fetch'):
+            update_resampled(store, loader, trading_pair, [interval], start, end)
+    elif loader:
+        with span('fetch'):
+            store.update(loader, trading_pair, interval, start=start, end=end)
+    if (args.indicator, strat) not in STRATEGIES:
+        #Strategy used when -s is not one of the -I indicator's strategies
+        strat = default_strategy(args.indicator)
+    if args.chunk:
+        #Out-of-core: only one chunk of klines is held at a time
+        stream = signal_chunks(chunks(store, trading_pair, interval, args.chunk, start, end),
+                               get_strategy(args.indicator, strat))
+        test = ChunkedBacktest(100000, periods_per_year=periods_per_year(interval), costs=fees, size=size,
+                               stop_loss=stop_loss, take_profit=take_profit)
+        closed = []
+        for trades in test.run(stream):
+            for trade in trades:
+                print(f"BUY at {trade['entry_price']} SELL at {trade['exit_price']}")
+            if args.trades_out:
+                closed.append(trades)
+        print("Trading Pair: " + trading_pair)
+        print("Interval: " + interval)
+        print("Candles: " + str(test.bars))
+        print("Ending amount: " + str(test.amount))
+        print("Number of Trades: " + str(test.num_trades))
+        print("Percentage of Profitable Trades: " + str(test.win_rate) + "%")
+        print(str(test.percent) + "% of starting amount")
+        print("Fees paid: " + str(test.fees))
+        print("Max drawdown: " + str(test.max_drawdown) + "%")
+        print("Sharpe ratio: " + str(test.sharpe))
+        print("Exposure: " + str(test.exposure) + "% of bars")
+        if args.trades_out:
+            #Trade bars are counted over the whole range; only the open_time column is mapped in for them
+            open_time = store.load(trading_pair, interval, start=start, end=end, names=['open_time'])['open_time']
+            write_records(trade_table(np.concatenate(closed) if closed else np.zeros(0, dtype=TRADE_DTYPE),
+                                      open_time), args.trades_out)
+        return True
+    with span('load'):
+        klines = Klines.from_columns(store.load(trading_pair, interval, start=start, end=end))
+    count('candles_loaded', len(klines))
+    if not len(klines):
+        print(f'No stored klines for {trading_pair} {interval}')
         return False
-main()
+    if args.walk_forward:
+        #Every registered strategy of -I, over the sweep ranges of its indicator's parameters
+        grid = {'MACD': {'fastperiod': args.fast, 'slowperiod': args.slow, 'signalperiod': args.signal},
+                'RSI': {'timeperiod': args.rsi_period}}
+        params = configs(args.indicator, grid)
+        table = run_walkforward(klines, args.indicator, params, args.train, args.test, args.step, args.metric,
+                                processes=args.processes, costs=fees, size=size, stop_loss=stop_loss,
+                                take_profit=take_profit, periods_per_year=periods_per_year(interval))
+        write_results(table, args.output or 'walkforward.csv')
+        print(table.to_string(index=False))
+        print(f'Out of sample: {chained_percent(table)}% of starting amount over {len(table)} windows')
+        return True
+    strategy = Strategy(args.indicator, strat, trading_pair, interval, klines)
+    strategy.plotIndicator()
+    time = strategy.getTime()
+    test = Backtest(100000, time[0], time[len(time) - 1], strategy, costs=fees, size=size, stop_loss=stop_loss,
+                    take_profit=take_profit)
+    test.printResults()
+    if args.signals_out:
+        write_records(strategy.getStrategyResult(), args.signals_out)
+    if args.trades_out:
+        write_records(trade_table(test.results.trades, klines.open_time), args.trades_out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Batch analysis: many symbols x many intervals in one process
+
+Klines for every (symbol, interval) are fetched concurrently on a thread
+pool under one shared request-weight budget, then each requested indicator
+chart is rendered headless into the output directory on a process pool.
+Per-stage timings are collected and reported at the end.
+"""
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from history import HistoryLoader
+from ratelimit import RateLimiter
+from render import render_many
+from resample import BASE, resample_store
+from scanner import stored_symbols
+
+AUTO_INTERVALS = ['1d', '4h', '1h', '30m', '15m', '5m', '1m']
+
+
+class Timings:
+    """ Accumulates wall time and call counts per stage, thread-safe enough for += under the GIL """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def add(self, stage, seconds):
+        self.seconds[stage] += seconds
+        self.calls[stage] += 1
+
+    def report(self):
+        lines = [f'{"stage":<12}{"calls":>8}{"seconds":>12}']
+        for stage, seconds in self.seconds.items():
+            lines.append(f'{stage:<12}{self.calls[stage]:>8}{seconds:>12.3f}')
+        return '\n'.join(lines)
+
+    def as_dict(self):
+        return {stage: {'calls': self.calls[stage], 'seconds': seconds} for stage, seconds in self.seconds.items()}
+
+
+def resolve_symbols(client, symbols):
+    """ Expands 'USDT' (or any quote asset) into every trading pair quoted in it """
+    resolved = []
+    for symbol in symbols:
+        if symbol.upper() in ('USDT', 'BUSD', 'BTC', 'ETH', 'BNB'):
+            info = client.get_exchange_info()
+            resolved.extend(entry['symbol'] for entry in info['symbols']
+                            if entry['quoteAsset'] == symbol.upper() and entry['status'] == 'TRADING')
+        else:
+            resolved.append(symbol.upper())
+    return list(dict.fromkeys(resolved))
+
+
+def fetch_all(store, loader, pairs, workers, timings, start=None, end=None):
+    """ Updates the store for every (symbol, interval) pair concurrently, returns the pairs that failed """
+    def fetch(pair):
+        began = time.perf_counter()
+        store.update(loader, *pair, start=start, end=end)
+        return time.perf_counter() - began
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch, pair): pair for pair in pairs}
+        for future in as_completed(futures):
+            try:
+                timings.add('fetch', future.result())
+            except Exception as err:
+                print(f'Error fetching {futures[future]}: {err}')
+                failed.append(futures[future])
+    return failed
+
+
+def render_all(store, pairs, indicators, outdir, timings, start=None, end=None, processes=None):
+    """ Renders every indicator chart of every pair to outdir on a process pool, returns the written paths """
+    jobs = [(symbol, interval, indicators, outdir, store.root, start, end) for symbol, interval in pairs]
+    written = []
+    for job, result in render_many(jobs, processes):
+        if isinstance(result, Exception):
+            print(f'Error rendering {job[0]} {job[1]}: {result}')
+            continue
+        paths, seconds = result
+        for stage, spent in seconds.items():
+            timings.add(stage, spent)
+        written.extend(paths)
+    return written
+
+
+def run_batch(client, store, symbols, intervals, indicators, outdir='charts', workers=8,
+              weight_per_minute=1200, start=None, end=None, offline=False, processes=None, resample=False):
+    """
+    Fetches and charts every symbol x interval, returns the Timings. With
+    resample only the 1m candles are fetched and every interval is built
+    from them.
+    """
+    timings = Timings()
+    os.makedirs(outdir, exist_ok=True)
+    began = time.perf_counter()
+    if offline:
+        stored = [BASE] if resample else intervals
+        symbols = list(dict.fromkeys(symbol for interval in stored
+                                     for symbol in stored_symbols(store, symbols, interval)))
+    else:
+        symbols = resolve_symbols(client, symbols)
+    pairs = [(symbol, interval) for symbol in symbols for interval in intervals]
+    if not offline:
+        loader = HistoryLoader(client, workers=2, limiter=RateLimiter(weight_per_minute))
+        fetched = [(symbol, BASE) for symbol in symbols] if resample else pairs
+        failed = fetch_all(store, loader, fetched, workers, timings, start, end)
+        pairs = [pair for pair in pairs if (pair[0], BASE if resample else pair[1]) not in failed]
+    timings.add('fetch_wall', time.perf_counter() - began)
+    if resample:
+        began = time.perf_counter()
+        for symbol, interval in pairs:
+            if interval != BASE:
+                resample_store(store, symbol, interval)
+        timings.add('resample', time.perf_counter() - began)
+    began = time.perf_counter()
+    written = render_all(store, pairs, indicators, outdir, timings, start, end, processes)
+    timings.add('render_wall', time.perf_counter() - began)
+    print(f'Wrote {len(written)} charts for {len(pairs)} symbol/interval pairs to {outdir}')
+    print(timings.report())
+    with open(os.path.join(outdir, 'timings.json'), 'w') as f:
+        json.dump(timings.as_dict(), f, indent=2)
+    return timings
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the kline -> indicator -> strategy -> backtest -> chart pipeline
+
+Synthetic klines (mockapi.synthetic_columns, deterministic, no network) of
+each requested size are written to a temporary kline store and pushed
+through the same code paths app.py and backtest.py use. Every stage is timed
+on its own (best of --repeat runs) and then run once more under tracemalloc
+for its peak memory. Results are written as JSON; pass an earlier file with
+--compare to see the speedup per stage.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import talib
+
+from app import GENERATORS, TaGenerator
+from backtest import Backtest, Strategy
+from indicator_cache import IndicatorCache
+from klinestore import KlineStore, rows_to_columns
+from mockapi import synthetic_columns, synthetic_rows
+from registry import STRATEGIES
+
+SIZES = [1000, 10000, 100000, 1000000]
+SYMBOL = 'BTCUSDT'
+INTERVAL = '1m'
+
+
+def measure(function, repeat, memory=True):
+    """ Best wall time of repeat calls, then the tracemalloc peak of one more """
+    best = float('inf')
+    for _ in range(repeat):
+        began = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - began)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, peak
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def stages(store, size, outdir, parse_limit):
+    """ Yields (stage name, callable) for one dataset size, in pipeline order """
+    if size <= parse_limit:
+        #Raw REST rows, parsed the way history.HistoryLoader parses every fetched page
+        rows = synthetic_rows(SYMBOL, INTERVAL, 0, size)
+        yield 'parse_rows', lambda: rows_to_columns(rows)
+
+    def load():
+        return TaGenerator(SYMBOL, INTERVAL, store=store, offline=True, headless=True, cache=IndicatorCache())
+    yield 'load', load
+
+    tagen = load()
+    for indicator, method in GENERATORS.items():
+        if indicator == 'ALL':
+            continue
+
+        #A fresh cache every call, so each run computes the indicator
+        def generate(method=method):
+            tagen.cache = IndicatorCache()
+            getattr(tagen, method)()
+            tagen.plt.close()
+        yield f'generate_{indicator.lower()}', generate
+
+        def render(indicator=indicator):
+            tagen.save(p, os.path.join(outdir, f'{indicator}.png'))
+        p = getattr(tagen, method)()
+        yield f'render_{indicator.lower()}', render
+        p.close()
+
+    klines = tagen.klines
+    for indicator, strategy in STRATEGIES:
+        name = f'{indicator.lower()}_{strategy.lower()}'
+        yield f'indicator_{name}', lambda indicator=indicator, strategy=strategy: Strategy(
+            indicator, strategy, SYMBOL, INTERVAL, klines, cache=IndicatorCache())
+        strat = Strategy(indicator, strategy, SYMBOL, INTERVAL, klines)
+        yield f'strategy_{name}', strat.calculateStrategy
+        test = Backtest(100000, strat.time[0], strat.time[-1], strat)
+        yield f'backtest_{name}', test.runBacktest
+
+
+def run(sizes, repeat=3, memory=True, parse_limit=1000000):
+    """ Runs every stage for every size, returns a list of result dicts """
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        store = KlineStore(os.path.join(root, 'klines'))
+        for size in sizes:
+            store.write(SYMBOL, INTERVAL, synthetic_columns(SYMBOL, INTERVAL, 0, size))
+            for stage, function in stages(store, size, root, parse_limit):
+                seconds, peak = measure(function, repeat, memory)
+                results.append({'size': size, 'stage': stage, 'seconds': seconds,
+                                'candles_per_sec': size / seconds if seconds else None, 'peak_bytes': peak})
+                print(f'{size:>10} {stage:<24}{seconds:>10.4f}s {size / max(seconds, 1e-9):>14,.0f} candles/s'
+                      + (f' {peak / 1e6:>10.1f} MB' if peak is not None else ''))
+    return results
+
+
+def compare(results, baseline):
+    """ Prints the speedup of every (size, stage) found in both runs """
+    before = {(entry['size'], entry['stage']): entry['seconds'] for entry in baseline['results']}
+    print(f'\nAgainst {baseline.get("commit")}:')
+    for entry in results:
+        old = before.get((entry['size'], entry['stage']))
+        if old:
+            print(f'{entry["size"]:>10} {entry["stage"]:<24}{old:>10.4f}s -> {entry["seconds"]:.4f}s '
+                  f'({old / entry["seconds"]:.2f}x)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis pipeline on synthetic klines')
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='Candle counts to benchmark')
+    parser.add_argument('--repeat', default=3, type=int, help='Timed runs per stage, the best one is kept')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', default=True,
+                        help='Skip the tracemalloc peak memory run')
+    parser.add_argument('--parse-limit', dest='parse_limit', default=1000000, type=int,
+                        help='Largest size whose raw rows are built for parse_rows (they take ~1KB a candle)')
+    parser.add_argument('-o', '--output', default='bench.json', type=str, help='JSON file for the results')
+    parser.add_argument('--compare', default=None, type=str, help='Earlier bench.py JSON to compare against')
+    args = parser.parse_args()
+    results = run(args.sizes, args.repeat, args.memory, args.parse_limit)
+    report = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'talib': talib.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {args.output}')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
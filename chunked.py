@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Out-of-core backtests over very long histories
+
+The kline store is read in fixed-size chunks of memory-mapped rows and
+pushed through a generator pipeline: chunks -> indicators -> signals ->
+ChunkedBacktest. Every stage carries just enough state from one chunk to the
+next, so memory is bounded by the chunk size however long the history is.
+
+- Indicators keep the tail of their inputs as warm-up for the next chunk.
+  Windowed ones keep one lookback, which is exact. Recursive ones (EMA,
+  MACD, RSI, ...) keep indicator_cache.SETTLE lookbacks, which agrees with
+  the whole-series values to about 1e-12, the same way the indicator cache
+  extends appended series. SAR never converges after a restart and is
+  refused.
+- Strategies carry their position in a state dict (see signals.py).
+- The backtest carries an open position into the next chunk by replaying its
+  entry bar in front of it, and keeps running totals instead of the equity
+  curve.
+"""
+import numpy as np
+import talib as ta
+
+from engine import run_backtest
+from indicator_cache import PATH_DEPENDENT, RECURSIVE, SETTLE, lookback
+from klines import FIELDS, Klines
+from profiling import count, span, timed
+from registry import INDICATORS, dependencies
+from signals import BUY
+
+# Candles per chunk: 6 columns of 8 bytes, about 48MB
+CHUNK = 1000000
+
+
+def chunks(store, symbol, interval, size=CHUNK, start=None, end=None):
+    """
+    Yields the stored candles in [start, end] as Klines of at most size rows.
+    Every chunk is copied out of freshly opened memmaps that are dropped right
+    after, so the pages of earlier chunks do not stay mapped.
+    """
+    total = len(store.load(symbol, interval, start=start, end=end)['open_time'])
+    for first in range(0, total, size):
+        with span('load'):
+            columns = store.load(symbol, interval, start=start, end=end)
+            klines = Klines({name: np.array(columns[name][first:first + size]) for name, _ in FIELDS})
+            del columns
+        count('candles_loaded', len(klines))
+        yield klines
+
+
+class ChunkedIndicator:
+
+    def __init__(self, indicator):
+        if indicator.function in PATH_DEPENDENT:
+            raise ValueError(f'{indicator.function} depends on the whole history and cannot be chunked')
+        self.indicator = indicator
+        warmup = lookback(indicator.function, indicator.params)
+        #Input bars kept for the next chunk
+        self.keep = warmup * SETTLE if indicator.function in RECURSIVE else warmup
+        self.tail = None
+
+    def update(self, inputs):
+        """ Outputs for the new chunk of inputs """
+        if self.tail is not None:
+            inputs = [np.concatenate((old, new)) for old, new in zip(self.tail, inputs)]
+        skip = 0 if self.tail is None else len(self.tail[0])
+        with span(f'talib.{self.indicator.function}'):
+            outputs = getattr(ta, self.indicator.function)(*inputs, **self.indicator.params)
+        outputs = outputs if isinstance(outputs, tuple) else (outputs,)
+        self.tail = [array[max(len(array) - self.keep, 0):] for array in inputs]
+        return tuple(output[skip:] for output in outputs)
+
+
+def indicator_chunks(stream, keys):
+    """ (klines, {'KEY.output': array}) of every chunk, keys computed with their dependencies """
+    order = [ChunkedIndicator(INDICATORS[key]) for key in dependencies(keys)]
+    for klines in stream:
+        values = {}
+        for calculator in order:
+            indicator = calculator.indicator
+            inputs = [values[ref] if '.' in ref else klines[ref] for ref in indicator.inputs]
+            values.update(zip(indicator.refs(), calculator.update(inputs)))
+        yield klines, values
+
+
+def signal_chunks(stream, rule):
+    """ (klines, int8 signals) of every chunk for a registry.Rule """
+    state = {}
+    for klines, values in indicator_chunks(stream, rule.requires):
+        with span('signals'):
+            signals = rule.signals(values, state)
+        yield klines, signals
+
+
+class ChunkedBacktest:
+    """
+    engine.run_backtest over a stream of (klines, signals) chunks. Closed
+    trades are returned per chunk by feed() with bar indices counted from the
+    first chunk; the totals mirror engine.BacktestResult.
+    """
+
+    def __init__(self, starting_amount=100000, periods_per_year=None, **options):
+        self.starting_amount = starting_amount
+        self.amount = starting_amount
+        self.periods_per_year = periods_per_year
+        #costs, size, stop_loss, take_profit for engine.run_backtest
+        self.options = options
+        #Bars fed so far
+        self.bars = 0
+        self.num_trades = 0
+        self.profitable_trades = 0
+        self.fees = 0.0
+        #Bars a position was held at the close
+        self.held = 0
+        #Open position: global bar index and (close, high, low, open) of its entry bar
+        self.entry = None
+        self.entry_bar = None
+        #Running equity figures
+        self.peak = 0.0
+        self.max_drawdown = 0.0
+        self.last_equity = None
+        self.returns = 0
+        self.returns_sum = 0.0
+        self.returns_squares = 0.0
+
+    @timed('runBacktest')
+    def feed(self, klines, signals):
+        """ Backtests one chunk, returns its closed trades (engine.TRADE_DTYPE) """
+        prices = [klines.close, klines.high, klines.low, klines.open]
+        carried = self.entry is not None
+        if carried:
+            #The open position is re-entered on a copy of its entry bar
+            signals = np.concatenate(([BUY], signals)).astype(np.int8)
+            prices = [np.concatenate(([value], array)) for value, array in zip(self.entry_bar, prices)]
+        close, high, low, open_ = prices
+        result = run_backtest(signals, close, self.amount, high=high, low=low, open_=open_, **self.options)
+
+        offset = self.bars - carried
+        trades = result.trades.copy()
+        trades['entry'] += offset
+        trades['exit'] += offset
+        if carried and len(trades):
+            trades['entry'][0] = self.entry
+        equity = result.equity[carried:]
+
+        self.bars += len(klines)
+        self.amount = result.amount
+        self.num_trades += result.num_trades
+        self.profitable_trades += result.profitable_trades
+        self.fees += result.fees
+        #The replayed entry bar was counted in the previous chunk
+        self.held += int(np.sum(result.trades['exit'] - result.trades['entry'])) - carried
+        if result.open_position:
+            entry = int(result.entries[-1])
+            self.held += len(result.equity) - entry
+            self.entry = self.entry if carried and entry == 0 else entry + offset
+            self.entry_bar = [float(array[entry]) for array in prices]
+        else:
+            self.entry = self.entry_bar = None
+        if len(equity):
+            self.track(equity)
+        return trades
+
+    def track(self, equity):
+        """ Drawdown and per-bar return totals, continuing from the previous chunk """
+        peaks = np.maximum(np.maximum.accumulate(equity), self.peak)
+        self.max_drawdown = max(self.max_drawdown, float(np.max(1 - equity / peaks)) * 100)
+        self.peak = float(peaks[-1])
+        if self.last_equity is not None:
+            equity = np.concatenate(([self.last_equity], equity))
+        returns = np.diff(equity) / equity[:-1]
+        self.returns += len(returns)
+        self.returns_sum += float(returns.sum())
+        self.returns_squares += float(np.square(returns).sum())
+        self.last_equity = float(equity[-1])
+
+    def run(self, stream):
+        """ Feeds every (klines, signals) chunk, yielding each chunk's closed trades """
+        for klines, signals in stream:
+            yield self.feed(klines, signals)
+
+    @property
+    def open_position(self):
+        return self.entry is not None
+
+    @property
+    def win_rate(self):
+        if not self.num_trades:
+            return 0.0
+        return self.profitable_trades / self.num_trades * 100
+
+    @property
+    def percent(self):
+        return self.amount / self.starting_amount * 100
+
+    @property
+    def sharpe(self):
+        if self.returns < 2:
+            return 0.0
+        mean = self.returns_sum / self.returns
+        deviation = np.sqrt(max(self.returns_squares / self.returns - mean * mean, 0.0))
+        if not deviation:
+            return 0.0
+        return float(mean / deviation * np.sqrt(self.periods_per_year or 1))
+
+    @property
+    def exposure(self):
+        if not self.bars:
+            return 0.0
+        return self.held / self.bars * 100
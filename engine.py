@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Backtest engine
+
+Consumes an int8 signal array (see signals.py) and the klines, and walks the
+events of a long-only account: a BUY while flat opens a position at the
+close of its bar, a SELL while long closes it, and an optional stop-loss or
+take-profit closes it earlier inside a bar, judged on that bar's high and
+low. BUYs while long and SELLs while flat are ignored.
+
+Fills pay taker or maker fees and slippage (see Costs), and each entry
+commits a fraction of the cash. Only the events are visited: trades are
+found with NumPy searches over the signal indices (the bars between a fill
+and its stop are scanned as one vectorized comparison), and the account is
+then rolled forward over all trades and bars at once. The cost is O(bars)
+in NumPy plus O(trades) in Python, without a per-bar Python loop.
+"""
+import numpy as np
+
+from profiling import count
+from signals import BUY, SELL
+
+# Why a trade was closed
+EXIT_SIGNAL = 0
+EXIT_STOP_LOSS = 1
+EXIT_TAKE_PROFIT = 2
+
+TRADE_DTYPE = np.dtype([
+    ('entry', np.int64),
+    ('exit', np.int64),
+    ('entry_price', np.float64),
+    ('exit_price', np.float64),
+    ('quantity', np.float64),
+    ('fees', np.float64),
+    ('pnl', np.float64),
+    ('reason', np.int8),
+])
+
+
+class Costs:
+    """
+    Trading costs. Fees are fractions of the traded notional: market orders
+    (signals and stop-losses) pay taker, take-profit limit orders pay maker.
+    Slippage moves market fills against us, by a fraction of the price with
+    model='fixed' or by a fraction of the bar's high-low range with
+    model='range'. Limit fills have no slippage.
+    """
+
+    def __init__(self, taker=0.0, maker=0.0, slippage=0.0, model='fixed'):
+        if model not in ('fixed', 'range'):
+            raise ValueError(f'Unknown slippage model {model}')
+        self.taker = taker
+        self.maker = maker
+        self.slippage = slippage
+        self.model = model
+
+    def slip(self, price, high, low, side):
+        """ Market fill price for side (BUY/SELL) at price on bars with the given high/low """
+        if self.model == 'range':
+            return price + side * self.slippage * (high - low)
+        return price * (1 + side * self.slippage)
+
+
+class BacktestResult:
+
+    def __init__(self, starting_amount, amount, equity, entries, exits, returns, trades=None,
+                 periods_per_year=None, open_price=None, start=0):
+        #Amount the backtest started with
+        self.starting_amount = starting_amount
+        #Amount after the last closed trade (an open position is not counted)
+        self.amount = amount
+        #Marked-to-market equity at every bar of the window
+        self.equity = equity
+        #Bar indices of the entry and exit fills
+        self.entries = entries
+        self.exits = exits
+        #Cash out / cash in ratio of every closed trade, after costs
+        self.returns = returns
+        #TRADE_DTYPE record of every closed trade
+        self.trades = trades if trades is not None else np.zeros(0, dtype=TRADE_DTYPE)
+        #Bars per year, for the annualized Sharpe ratio
+        self.periods_per_year = periods_per_year
+        #Entry fill price of the position still open at the end, if any
+        self.open_price = open_price
+        #Bar index of the first bar of the window, entries and exits count from bar 0
+        self.start = start
+
+    @property
+    def num_trades(self):
+        return len(self.returns)
+
+    @property
+    def profitable_trades(self):
+        return int(np.count_nonzero(self.returns > 1))
+
+    @property
+    def win_rate(self):
+        if not self.num_trades:
+            return 0.0
+        return self.profitable_trades / self.num_trades * 100
+
+    @property
+    def percent(self):
+        return self.amount / self.starting_amount * 100
+
+    @property
+    def open_position(self):
+        return len(self.entries) > len(self.exits)
+
+    @property
+    def fees(self):
+        return float(self.trades['fees'].sum())
+
+    @property
+    def max_drawdown(self):
+        """ Largest fall from an equity high, as a percentage of that high """
+        if not len(self.equity):
+            return 0.0
+        return float(np.max(1 - self.equity / np.maximum.accumulate(self.equity))) * 100
+
+    @property
+    def sharpe(self):
+        """ Mean over standard deviation of the per-bar equity returns, annualized when periods_per_year is known """
+        if len(self.equity) < 3:
+            return 0.0
+        returns = np.diff(self.equity) / self.equity[:-1]
+        deviation = returns.std()
+        if not deviation:
+            return 0.0
+        return float(returns.mean() / deviation * np.sqrt(self.periods_per_year or 1))
+
+    @property
+    def exposure(self):
+        """ Percentage of bars a position was held at the close """
+        if not len(self.equity):
+            return 0.0
+        held = int(np.sum(self.trades['exit'] - self.trades['entry']))
+        if self.open_position:
+            held += self.start + len(self.equity) - int(self.entries[-1])
+        return held / len(self.equity) * 100
+
+
+def positions(signals):
+    """ 1 while long, 0 while flat: the latest BUY/SELL forward-filled """
+    latest = np.where(signals != 0, np.arange(len(signals)), -1)
+    np.maximum.accumulate(latest, out=latest)
+    return ((latest >= 0) & (signals[latest] == BUY)).astype(np.int8)
+
+
+def signal_trades(signals):
+    """ (entries, exits) of the BUY -> SELL round trips, the last entry may be open """
+    fills = np.diff(positions(signals), prepend=np.int8(0))
+    return np.flatnonzero(fills == 1), np.flatnonzero(fills == -1)
+
+
+def stop_trades(signals, close, high, low, open_, costs, stop_loss, take_profit):
+    """
+    Walks the trades when stops are set: after each entry the bars up to the
+    next SELL are checked for the stop/target levels in one comparison.
+    Returns entries, exits, exit prices and reasons; the last entry may be open.
+    A bar that touches both levels is taken as the stop-loss unless it opened
+    beyond the target, and a bar that opens beyond a level fills at its open.
+    """
+    buys = np.flatnonzero(signals == BUY)
+    sells = np.flatnonzero(signals == SELL)
+    entries, exits, prices, reasons = [], [], [], []
+    after = 0
+    while True:
+        b = np.searchsorted(buys, after)
+        if b == len(buys):
+            break
+        entry = int(buys[b])
+        entries.append(entry)
+        s = np.searchsorted(sells, entry, side='right')
+        last = int(sells[s]) if s < len(sells) else len(close) - 1
+        fill = costs.slip(close[entry], high[entry], low[entry], BUY)
+        stop = fill * (1 - stop_loss) if stop_loss else -np.inf
+        target = fill * (1 + take_profit) if take_profit else np.inf
+        window = slice(entry + 1, last + 1)
+        hit = (low[window] <= stop) | (high[window] >= target)
+        if hit.any():
+            k = entry + 1 + int(np.argmax(hit))
+            if open_[k] >= target or (high[k] >= target and low[k] > stop):
+                exits.append(k)
+                prices.append(max(open_[k], target))
+                reasons.append(EXIT_TAKE_PROFIT)
+            else:
+                exits.append(k)
+                prices.append(costs.slip(min(open_[k], stop), high[k], low[k], SELL))
+                reasons.append(EXIT_STOP_LOSS)
+        elif s < len(sells):
+            exits.append(last)
+            prices.append(costs.slip(close[last], high[last], low[last], SELL))
+            reasons.append(EXIT_SIGNAL)
+        else:
+            break
+        #The stop fills inside the bar, a BUY at that bar's close can open the next trade
+        after = exits[-1] + (reasons[-1] == EXIT_SIGNAL)
+    return (np.array(entries, dtype=np.int64), np.array(exits, dtype=np.int64), np.array(prices, dtype=np.float64),
+            np.array(reasons, dtype=np.int8))
+
+
+def run_backtest(signals, close, starting_amount=100000, start=0, stop=None, high=None, low=None, open_=None,
+                 costs=None, size=1.0, stop_loss=None, take_profit=None, periods_per_year=None):
+    """
+    Backtests bars [start, stop). Signals outside the window are ignored, so a
+    SELL inside it whose BUY came before start does nothing. Each entry spends
+    size (0 < size <= 1) of the cash, fees included. stop_loss and
+    take_profit are fractions of the entry fill price; they need high and low,
+    and use open_ for bars that gap through them. Without them every fill is
+    at the close of its signal bar.
+    """
+    if not 0 < size <= 1:
+        raise ValueError('size must be in (0, 1]')
+    costs = costs or Costs()
+    signals = signals[start:stop]
+    close = close[start:stop]
+    high = close if high is None else high[start:stop]
+    low = close if low is None else low[start:stop]
+    open_ = close if open_ is None else open_[start:stop]
+    count('candles_backtested', len(close))
+
+    if stop_loss or take_profit:
+        entries, exits, exit_prices, reasons = stop_trades(signals, close, high, low, open_, costs, stop_loss,
+                                                           take_profit)
+    else:
+        entries, exits = signal_trades(signals)
+        exit_prices = costs.slip(close[exits], high[exits], low[exits], SELL)
+        reasons = np.full(len(exits), EXIT_SIGNAL, dtype=np.int8)
+
+    closed = len(exits)
+    entry_prices = costs.slip(close[entries], high[entries], low[entries], BUY)
+    exit_fees = np.where(reasons == EXIT_TAKE_PROFIT, costs.maker, costs.taker)
+    returns = exit_prices * (1 - exit_fees) / (entry_prices[:closed] * (1 + costs.taker))
+    #Cash before each entry: every closed trade scales the cash by its multiplier
+    cash = starting_amount * np.cumprod(np.concatenate(([1.0], 1 - size + size * returns)))
+    amount = float(cash[closed])
+    quantity = cash[:len(entries)] * size / (entry_prices * (1 + costs.taker))
+    fees = quantity[:closed] * (entry_prices[:closed] * costs.taker + exit_prices * exit_fees)
+
+    trades = np.zeros(closed, dtype=TRADE_DTYPE)
+    trades['entry'] = entries[:closed] + start
+    trades['exit'] = exits + start
+    trades['entry_price'] = entry_prices[:closed]
+    trades['exit_price'] = exit_prices
+    trades['quantity'] = quantity[:closed]
+    trades['fees'] = fees
+    trades['pnl'] = cash[1:closed + 1] - cash[:closed]
+    trades['reason'] = reasons
+
+    #After the starting state, fills alternate entry, exit, entry, ... in
+    #time; each bar is valued with the state after the last fill at or before it
+    bars = np.empty(1 + len(entries) + closed, dtype=np.int64)
+    bars[0] = -1
+    bars[1::2] = entries
+    bars[2::2] = exits
+    state_cash = np.empty(len(bars))
+    state_cash[0] = starting_amount
+    state_cash[1::2] = cash[:len(entries)] * (1 - size)
+    state_cash[2::2] = cash[1:closed + 1]
+    state_quantity = np.zeros(len(bars))
+    state_quantity[1::2] = quantity
+    last = np.searchsorted(bars, np.arange(len(close)), side='right') - 1
+    equity = state_cash[last] + state_quantity[last] * close
+
+    open_price = float(entry_prices[-1]) if len(entries) > closed else None
+    return BacktestResult(starting_amount, amount, equity, entries + start, exits + start, returns, trades,
+                          periods_per_year, open_price, start)
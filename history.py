@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Bulk kline history loader
+
+Splits a date range into PAGE_LIMIT-candle pages, fetches them on a bounded
+thread pool with retry/backoff and stitches them into one sorted,
+de-duplicated set of columns.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from klinestore import COLUMNS, PAGE_LIMIT, empty_columns, interval_ms, rows_to_columns
+from profiling import count, span
+from ratelimit import kline_weight
+
+# HTTP statuses worth retrying: rate limits, IP bans and server side errors
+RETRY_STATUS = {418, 429, 500, 502, 503, 504}
+
+
+def parse_date(text):
+    """ Parses a CLI date (ISO date/datetime, taken as UTC, or epoch ms) into epoch ms """
+    if text is None:
+        return None
+    if str(text).isdigit():
+        return int(text)
+    moment = datetime.fromisoformat(str(text))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def stitch(pages):
+    """ Concatenates column pages, sorted by open_time with duplicates dropped """
+    pages = [page for page in pages if len(page['open_time'])]
+    if not pages:
+        return empty_columns()
+    merged = {name: np.concatenate([page[name] for page in pages]) for name, _ in COLUMNS}
+    _, first = np.unique(merged['open_time'], return_index=True)
+    return {name: column[first] for name, column in merged.items()}
+
+
+def find_gaps(open_time, interval):
+    """ Returns (last open_time before the gap, first open_time after it) for every missing stretch """
+    step = interval_ms(interval)
+    breaks = np.flatnonzero(np.diff(open_time) != step)
+    return [(int(open_time[i]), int(open_time[i + 1])) for i in breaks]
+
+
+class HistoryLoader:
+
+    def __init__(self, client, workers=4, retries=5, backoff=0.5, limiter=None):
+        self.client = client
+        # Optional ratelimit.RateLimiter shared with other loaders
+        self.limiter = limiter
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+
+    def pages(self, interval, start, end):
+        """ Splits [start, end] into (start, end) pairs of at most PAGE_LIMIT candles each """
+        step = interval_ms(interval)
+        span = step * PAGE_LIMIT
+        first = -(-start // step) * step
+        return [(page, min(page + span - 1, end)) for page in range(first, end + 1, span)]
+
+    def fetch_page(self, symbol, interval, start, end):
+        for attempt in range(self.retries + 1):
+            if self.limiter:
+                self.limiter.acquire(kline_weight(PAGE_LIMIT))
+            try:
+                with span('get_klines'):
+                    rows = self.client.get_klines(symbol=symbol, interval=interval, startTime=start,
+                                                  endTime=end, limit=PAGE_LIMIT)
+                count('candles_fetched', len(rows))
+                return rows
+            except Exception as err:
+                status = getattr(err, 'status_code', None)
+                if attempt == self.retries or (status is not None and status not in RETRY_STATUS):
+                    raise
+                time.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+
+    def latest(self, symbol, interval):
+        """ The default get_klines page: the most recent candles """
+        if self.limiter:
+            self.limiter.acquire(kline_weight())
+        with span('get_klines'):
+            rows = self.client.get_klines(symbol=symbol, interval=interval)
+        count('candles_fetched', len(rows))
+        return rows_to_columns(rows)
+
+    def load(self, symbol, interval, start, end=None):
+        """ Fetches every candle with open_time in [start, end] (end defaults to now) """
+        end = now_ms() if end is None else end
+        pages = self.pages(interval, start, end)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = pool.map(lambda page: self.fetch_page(symbol, interval, *page), pages)
+            columns = stitch([rows_to_columns(rows) for rows in results])
+        for before, after in find_gaps(columns['open_time'], interval):
+            print(f'Warning: {symbol} {interval} has no candles between {before} and {after}')
+        return columns
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Memoized TA-Lib indicators
+
+Results are keyed by (indicator, parameters, fingerprint of the input
+arrays) and kept in an in-memory LRU capped in bytes, optionally backed by a
+directory of memory-mapped .npy files that survives between runs.
+
+When the inputs are a cached series with candles appended, only the tail is
+computed: windowed indicators are re-run from one lookback before the new
+candles, which is exact. Recursive ones (EMA-based, Wilder smoothing) are
+re-run from SETTLE lookbacks back, where the restarted recursion agrees with
+a full run to about 1e-12. SAR's trend state never converges like that, so
+it is always computed in full.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import talib as ta
+from talib import abstract
+
+from profiling import count, span
+
+# Indicators whose value depends on the whole history rather than a window
+RECURSIVE = {'EMA', 'DEMA', 'TEMA', 'T3', 'KAMA', 'MACD', 'MACDEXT', 'RSI', 'ATR', 'NATR', 'ADX', 'ADXR', 'DX',
+             'PLUS_DI', 'MINUS_DI', 'CMO', 'MFI', 'STOCHRSI', 'TRIX', 'APO', 'PPO', 'ADOSC'}
+
+# Indicators whose state depends on the path taken, a restart does not converge to the full run
+PATH_DEPENDENT = {'SAR', 'SAREXT'}
+
+# How many lookbacks a recursive indicator is restarted before the appended candles.
+# Wilder smoothing (RSI, ATR, DX...) decays by (n - 1) / n a bar and needs about 40 to reach 1e-12
+SETTLE = 40
+
+
+def fingerprint(*arrays):
+    """ Content hash of the arrays (values, dtype and length) """
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f'{array.dtype.str}{array.shape}'.encode())
+        digest.update(array.data)
+    return digest.hexdigest()
+
+
+def lookback(name, params):
+    """ Bars TA-Lib needs before the first defined output """
+    function = abstract.Function(name)
+    # The abstract API is strict about types, talib.MACD etc. are not
+    defaults = function.parameters
+    function.parameters = {key: type(defaults[key])(value) for key, value in params.items()}
+    return function.lookback
+
+
+class IndicatorCache:
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        # key -> tuple of output arrays, least recently used first
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        # (name, params) -> {length: fingerprint} of the entries held in memory
+        self.series = {}
+        self.hits = 0
+        self.misses = 0
+        self.extended = 0
+        # Guards the LRU and counters; TA-Lib itself runs outside it, so threads still compute in parallel
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def series_key(name, params):
+        return name, tuple(sorted(params.items()))
+
+    def indicator(self, name, inputs, fp=None, **params):
+        """
+        Cached getattr(talib, name)(*inputs, **params), always returned as a
+        tuple of read-only arrays. fp may be passed when the caller already
+        knows the fingerprint of inputs.
+        """
+        series = self.series_key(name, params)
+        length = len(inputs[0])
+        key = (series, length, fp or fingerprint(*inputs))
+        with self.lock:
+            outputs = self.cached(key)
+            if outputs is not None:
+                self.hits += 1
+                count('cache_hits')
+                return outputs
+            self.misses += 1
+        count('cache_misses')
+        outputs = self.extend(name, params, inputs)
+        if outputs is None:
+            outputs = self.compute(name, params, inputs)
+        with self.lock:
+            self.store(key, outputs)
+        return outputs
+
+    def cached(self, key):
+        """ The entry of key from memory or disk, marked as most recently used, or None """
+        with self.lock:
+            outputs = self.entries.get(key)
+            if outputs is None:
+                return self.load(key)
+            self.entries.move_to_end(key)
+            return outputs
+
+    @staticmethod
+    def compute(name, params, inputs):
+        with span(f'talib.{name}'):
+            outputs = getattr(ta, name)(*inputs, **params)
+        return outputs if isinstance(outputs, tuple) else (outputs,)
+
+    def extend(self, name, params, inputs):
+        """ Reuses the longest cached result whose inputs are a prefix of these, or returns None """
+        if name in PATH_DEPENDENT:
+            return None
+        series = self.series_key(name, params)
+        length = len(inputs[0])
+        warm = lookback(name, params) * (SETTLE if name in RECURSIVE else 1) + 1
+        with self.lock:
+            known = sorted(self.known(series).items(), reverse=True)
+        for known, fp in known:
+            if known >= length or known <= warm:
+                continue
+            prefix = [array[:known] for array in inputs]
+            if fingerprint(*prefix) != fp:
+                continue
+            cached = self.cached((series, known, fp))
+            if cached is None:
+                continue
+            start = known - warm
+            tail = self.compute(name, params, [array[start:] for array in inputs])
+            with self.lock:
+                self.extended += 1
+            return tuple(np.concatenate((old, new[known - start:])) for old, new in zip(cached, tail))
+        return None
+
+    def known(self, series):
+        """ {length: fingerprint} of every entry of the series, in memory or on disk """
+        known = dict(self.series.get(series, {}))
+        if self.directory:
+            path = self.series_path(series)
+            if os.path.isdir(path):
+                for entry in os.listdir(path):
+                    length, _, fp = entry.partition('_')
+                    if length.isdigit() and not entry.endswith('.tmp'):
+                        known.setdefault(int(length), fp)
+        return known
+
+    def store(self, key, outputs, persist=True):
+        """ Adds an entry, replacing one another thread stored for the same key; the caller holds self.lock """
+        for output in outputs:
+            output.setflags(write=False)
+        replaced = self.entries.pop(key, None)
+        if replaced is not None:
+            self.nbytes -= sum(output.nbytes for output in replaced)
+        self.entries[key] = outputs
+        self.nbytes += sum(output.nbytes for output in outputs)
+        series, length, fp = key
+        self.series.setdefault(series, {})[length] = fp
+        if self.directory and persist:
+            self.save(key, outputs)
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            (series, length, _), evicted = self.entries.popitem(last=False)
+            self.nbytes -= sum(output.nbytes for output in evicted)
+            self.series[series].pop(length, None)
+
+    def series_path(self, series):
+        name, params = series
+        return os.path.join(self.directory, f'{name}-{hashlib.blake2b(repr(params).encode(), digest_size=8).hexdigest()}')
+
+    def entry_path(self, key):
+        series, length, fp = key
+        return os.path.join(self.series_path(series), f'{length}_{fp}')
+
+    def save(self, key, outputs):
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        #A private tmp directory, other threads and processes may be saving the same entry
+        tmp = tempfile.mkdtemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=os.path.dirname(path))
+        for i, output in enumerate(outputs):
+            np.save(os.path.join(tmp, f'{i}.npy'), output)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            #Someone else saved it first
+            shutil.rmtree(tmp)
+
+    def load(self, key):
+        """ Memory-maps an entry from the disk tier into the LRU, or returns None """
+        if not self.directory:
+            return None
+        path = self.entry_path(key)
+        if not os.path.isdir(path):
+            return None
+        outputs = tuple(np.load(os.path.join(path, f'{i}.npy'), mmap_mode='r')
+                        for i in range(len(os.listdir(path))))
+        with self.lock:
+            self.store(key, outputs, persist=False)
+        return outputs
+
+
+# Shared by every TaGenerator and Strategy in the process
+default_cache = IndicatorCache()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Kline container shared by TaGenerator, Strategy and Backtest
+
+Wraps the typed column arrays of the kline store (raw REST rows are parsed
+once, by klinestore.rows_to_columns, before they are stored). Every field
+is a contiguous array, memory-mapped or not, that TA-Lib and matplotlib can
+use without copying.
+"""
+import numpy as np
+
+from indicator_cache import fingerprint
+
+FIELDS = (
+    ('open_time', np.int64),
+    ('open', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('close', np.float64),
+    ('volume', np.float64),
+)
+
+
+class Klines:
+
+    def __init__(self, columns):
+        # name -> 1-d array, often store memmaps
+        self.columns = columns
+        #Field names -> content hash, see fingerprint()
+        self.fingerprints = {}
+
+    """ Wraps KlineStore columns as they are, memory-mapped columns stay memory-mapped """
+    @classmethod
+    def from_columns(cls, columns):
+        return cls({name: columns[name] for name, _ in FIELDS})
+
+    def __len__(self):
+        return len(self.columns['open_time'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def open_time(self):
+        return self.columns['open_time']
+
+    @property
+    def open(self):
+        return self.columns['open']
+
+    @property
+    def high(self):
+        return self.columns['high']
+
+    @property
+    def low(self):
+        return self.columns['low']
+
+    @property
+    def close(self):
+        return self.columns['close']
+
+    @property
+    def volume(self):
+        return self.columns['volume']
+
+    @property
+    def time(self):
+        """ open_time reinterpreted as datetime64[ms], no conversion or copy """
+        return self.columns['open_time'].view('datetime64[ms]')
+
+    def fingerprint(self, *names):
+        """ indicator_cache.fingerprint of the named columns, hashed once per container """
+        if names not in self.fingerprints:
+            self.fingerprints[names] = fingerprint(*(self.columns[name] for name in names))
+        return self.fingerprints[names]
+
+    def slice(self, start, stop):
+        """ Rows [start, stop) as views """
+        return Klines({name: column[start:stop] for name, column in self.columns.items()})
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Local kline store
+
+Klines are kept on disk as one .npy file per column under
+<root>/<SYMBOL>/<interval>/, so they can be memory-mapped back in and
+topped up with only the candles newer than the last stored open_time.
+"""
+import os
+
+import numpy as np
+
+from profiling import count, span
+
+# Column layout of a Binance kline row (the trailing 'ignore' field is dropped)
+COLUMNS = (
+    ('open_time', np.int64),
+    ('open', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('close', np.float64),
+    ('volume', np.float64),
+    ('close_time', np.int64),
+    ('quote_volume', np.float64),
+    ('trades', np.int64),
+    ('taker_base_volume', np.float64),
+    ('taker_quote_volume', np.float64),
+)
+
+INTERVAL_MS = {
+    '1m': 60 * 1000,
+    '3m': 3 * 60 * 1000,
+    '5m': 5 * 60 * 1000,
+    '15m': 15 * 60 * 1000,
+    '30m': 30 * 60 * 1000,
+    '1h': 60 * 60 * 1000,
+    '2h': 2 * 60 * 60 * 1000,
+    '4h': 4 * 60 * 60 * 1000,
+    '6h': 6 * 60 * 60 * 1000,
+    '8h': 8 * 60 * 60 * 1000,
+    '12h': 12 * 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+    '3d': 3 * 24 * 60 * 60 * 1000,
+    '1w': 7 * 24 * 60 * 60 * 1000,
+}
+
+# Largest page the klines endpoint will return
+PAGE_LIMIT = 1000
+
+
+def interval_ms(interval):
+    """ Length of a fixed-size interval in milliseconds """
+    try:
+        return INTERVAL_MS[interval]
+    except KeyError:
+        raise ValueError(f'Unsupported interval {interval}')
+
+
+def periods_per_year(interval):
+    """ Candles of interval in 365 days, None for intervals of varying length """
+    if interval not in INTERVAL_MS:
+        return None
+    return 365 * 24 * 60 * 60 * 1000 / INTERVAL_MS[interval]
+
+
+def empty_columns():
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+
+
+def rows_to_columns(rows):
+    """ Converts raw get_klines rows into a dict of typed column arrays """
+    if len(rows) == 0:
+        return empty_columns()
+    count('candles_parsed', len(rows))
+    with span('parse'):
+        # One pass through numpy's string parser instead of a float() per cell
+        table = np.array([row[:len(COLUMNS)] for row in rows], dtype=str)
+        return {name: table[:, i].astype(dtype) for i, (name, dtype) in enumerate(COLUMNS)}
+
+
+class KlineStore:
+
+    def __init__(self, root='klines'):
+        self.root = root
+
+    def path(self, symbol, interval):
+        return os.path.join(self.root, symbol.upper(), interval)
+
+    """
+    Loads the stored columns, memory-mapped unless mmap is False, optionally
+    limited to open_time in [start, end] and to the named columns (open_time
+    is always loaded)
+    """
+    def load(self, symbol, interval, mmap=True, start=None, end=None, names=None):
+        path = self.path(symbol, interval)
+        if not os.path.isdir(path):
+            return empty_columns()
+        columns = {}
+        for name, dtype in COLUMNS:
+            if names is not None and name != 'open_time' and name not in names:
+                continue
+            filename = os.path.join(path, f'{name}.npy')
+            if not os.path.exists(filename):
+                return empty_columns()
+            columns[name] = np.load(filename, mmap_mode='r' if mmap else None)
+        # A write interrupted between columns leaves them ragged, only trust the common prefix
+        length = min(len(column) for column in columns.values())
+        first = 0 if start is None else np.searchsorted(columns['open_time'][:length], start)
+        last = length if end is None else np.searchsorted(columns['open_time'][:length], end, side='right')
+        return {name: column[first:last] for name, column in columns.items()}
+
+    def last_open_time(self, symbol, interval):
+        open_time = self.load(symbol, interval)['open_time']
+        if len(open_time) == 0:
+            return None
+        return int(open_time[-1])
+
+    """ Replaces the stored columns, one atomic rename per column file """
+    def write(self, symbol, interval, columns):
+        path = self.path(symbol, interval)
+        os.makedirs(path, exist_ok=True)
+        for name, dtype in COLUMNS:
+            filename = os.path.join(path, f'{name}.npy')
+            tmp = filename + '.tmp'
+            with open(tmp, 'wb') as f:
+                np.save(f, np.ascontiguousarray(columns[name], dtype=dtype))
+            os.replace(tmp, filename)
+
+    """ Merges new candles in; where open_times collide the new candle wins """
+    def merge(self, symbol, interval, columns):
+        if len(columns['open_time']) == 0:
+            return
+        stored = self.load(symbol, interval)
+        merged = {name: np.concatenate((columns[name], stored[name])) for name, _ in COLUMNS}
+        _, first = np.unique(merged['open_time'], return_index=True)
+        self.write(symbol, interval, {name: column[first] for name, column in merged.items()})
+
+    """
+    Tops the store up through a history.HistoryLoader. Only what is missing is
+    fetched: candles before the first stored one when start reaches further
+    back, and everything from the last stored open_time (that candle may still
+    have been open when saved) to end. An empty store without a start is seeded
+    with the default get_klines page.
+    """
+    def update(self, loader, symbol, interval, start=None, end=None):
+        open_time = self.load(symbol, interval)['open_time']
+        if len(open_time) == 0:
+            if start is None:
+                self.merge(symbol, interval, loader.latest(symbol, interval))
+            else:
+                self.merge(symbol, interval, loader.load(symbol, interval, start, end))
+            return self.load(symbol, interval)
+        first, last = int(open_time[0]), int(open_time[-1])
+        if start is not None and start < first:
+            self.merge(symbol, interval, loader.load(symbol, interval, start, first - 1))
+        if end is None or end >= last:
+            self.merge(symbol, interval, loader.load(symbol, interval, last, end))
+        return self.load(symbol, interval)
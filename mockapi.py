@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the public Binance REST endpoints used by this project
+(ping, time, exchangeInfo and klines). Candles are synthetic but
+deterministic: the same symbol, interval and open_time always give the same
+candle, so overlapping requests stitch together exactly like real data.
+
+Point the scripts at it with --api-url http://127.0.0.1:8000
+"""
+import argparse
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from klinestore import COLUMNS, PAGE_LIMIT, interval_ms
+from ratelimit import kline_weight
+
+DEFAULT_SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'BNBUSDT', 'XRPUSDT', 'ADAUSDT', 'LTCUSDT', 'ETHBTC', 'BNBBTC']
+
+
+def _noise(keys, salt):
+    """ splitmix64 hash of each key, mapped onto [-1, 1) """
+    x = keys.astype(np.uint64) + np.uint64(salt) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) / float(1 << 52) - 1.0
+
+
+def _log_path(index, salt, sigma):
+    """
+    Random-walk-like log price as a pure function of the candle index: value
+    noise summed over octaves, each twice as coarse and sqrt(2) times as large
+    as the last, capped so the slowest octave moves price by about 50%
+    """
+    octaves = max(1, int(2 * np.log2(0.5 / sigma)))
+    path = np.zeros(len(index))
+    for octave in range(octaves):
+        cell = index >> np.int64(octave)
+        frac = (index - (cell << np.int64(octave))) / float(1 << octave)
+        left = _noise(cell, salt + octave)
+        right = _noise(cell + 1, salt + octave)
+        path += sigma * np.sqrt(1 << octave) * (left + (right - left) * frac)
+    return path
+
+
+def synthetic_columns(symbol, interval, start, count):
+    """ Builds count candles from the first open_time at or after start, as a column dict """
+    step = interval_ms(interval)
+    first = -(-int(start) // step) * step
+    open_time = first + step * np.arange(count, dtype=np.int64)
+    salt = zlib.crc32(symbol.encode())
+    base = 10.0 + salt % 50000
+    sigma = min(0.002 * np.sqrt(step / 60000.0), 0.1)
+
+    # Each candle opens at the previous candle's close
+    index = np.arange(count + 1, dtype=np.int64) + (first // step - 1)
+    price = base * np.exp(_log_path(index, salt, sigma))
+    open_ = price[:-1]
+    close = price[1:]
+    wick = np.abs(_noise(open_time // step, salt + 1)) * sigma
+    high = np.maximum(open_, close) * (1 + wick)
+    low = np.minimum(open_, close) * (1 - wick)
+    volume = 100.0 * (1.5 + _noise(open_time // step, salt + 2))
+    trades = (volume * 10).astype(np.int64)
+
+    return {
+        'open_time': open_time,
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': volume,
+        'close_time': open_time + step - 1,
+        'quote_volume': volume * close,
+        'trades': trades,
+        'taker_base_volume': volume / 2,
+        'taker_quote_volume': volume * close / 2,
+    }
+
+
+def synthetic_rows(symbol, interval, start, count):
+    """ Same candles rendered as the API would send them (prices as strings) """
+    columns = synthetic_columns(symbol, interval, start, count)
+    rows = []
+    for values in zip(*[columns[name].tolist() for name, _ in COLUMNS]):
+        row = []
+        for (name, dtype), value in zip(COLUMNS, values):
+            row.append(value if dtype is np.int64 else f'{value:.8f}')
+        row.append('0')
+        rows.append(row)
+    return rows
+
+
+class WeightCounter:
+    """ Request weight used per wall-clock minute, reported like Binance's X-MBX-USED-WEIGHT-1M """
+
+    def __init__(self):
+        self.minute = None
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def add(self, weight):
+        """ Counts weight, returns the total used this minute """
+        with self.lock:
+            minute = int(time.time() // 60)
+            if minute != self.minute:
+                self.minute, self.used = minute, 0
+            self.used += weight
+            return self.used
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Keep-alive, so pooled clients reuse their connections
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes, Nagle would hold the body back for the client's delayed ACK
+    disable_nagle_algorithm = True
+    symbols = DEFAULT_SYMBOLS
+    weight = WeightCounter()
+    # Weight per minute after which requests get 429, None for no limit
+    weight_limit = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200, used=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if used is not None:
+            self.send_header('X-MBX-USED-WEIGHT-1M', str(used))
+        if status == 429:
+            self.send_header('Retry-After', str(60 - int(time.time()) % 60))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == '/api/v3/klines':
+            try:
+                weight = kline_weight(int(params.get('limit', 500)))
+            except ValueError:
+                weight = 1
+        else:
+            weight = 20 if url.path == '/api/v3/exchangeInfo' else 1
+        used = self.weight.add(weight)
+        if self.weight_limit is not None and used > self.weight_limit:
+            self.send_json({'code': -1003, 'msg': 'Too much request weight used'}, status=429, used=used)
+        elif url.path == '/api/v3/ping':
+            self.send_json({}, used=used)
+        elif url.path == '/api/v3/time':
+            self.send_json({'serverTime': int(time.time() * 1000)}, used=used)
+        elif url.path == '/api/v3/exchangeInfo':
+            self.send_json({'symbols': [self.symbol_info(symbol) for symbol in self.symbols]}, used=used)
+        elif url.path == '/api/v3/klines':
+            self.klines(params, used)
+        else:
+            self.send_json({'code': -1, 'msg': f'Unknown path {url.path}'}, status=404)
+
+    def symbol_info(self, symbol):
+        for quote in ('USDT', 'BTC', 'BNB', 'ETH'):
+            if symbol.endswith(quote):
+                return {'symbol': symbol, 'status': 'TRADING', 'baseAsset': symbol[:-len(quote)], 'quoteAsset': quote}
+        return {'symbol': symbol, 'status': 'TRADING', 'baseAsset': symbol, 'quoteAsset': ''}
+
+    def klines(self, params, used=None):
+        try:
+            symbol = params['symbol']
+            step = interval_ms(params['interval'])
+            limit = min(int(params.get('limit', 500)), PAGE_LIMIT)
+        except (KeyError, ValueError) as err:
+            self.send_json({'code': -1100, 'msg': f'Bad parameters: {err}'}, status=400, used=used)
+            return
+        now = int(time.time() * 1000)
+        end = min(int(params.get('endTime', now)), now)
+        if 'startTime' in params:
+            start = int(params['startTime'])
+        else:
+            start = (end // step - limit + 1) * step
+        first = -(-start // step) * step
+        count = max(0, min(limit, (end - first) // step + 1))
+        self.send_json(synthetic_rows(symbol, params['interval'], first, count), used=used)
+
+
+def serve(host='127.0.0.1', port=8000, symbols=None, weight_limit=None):
+    if symbols:
+        Handler.symbols = symbols
+    Handler.weight_limit = weight_limit
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1', type=str, help='Address to listen on')
+    parser.add_argument('--port', default=8000, type=int, help='Port to listen on')
+    parser.add_argument('--symbols', nargs='+', default=None, help='Symbols listed by exchangeInfo')
+    parser.add_argument('--weight-limit', dest='weight_limit', default=None, type=int,
+                        help='Answer 429 once this much request weight was used in a minute')
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.symbols, args.weight_limit)
+    print(f'Serving mock Binance API on http://{args.host}:{server.server_port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Hot-path instrumentation
+
+Timing spans and counters placed around the pipeline's stages (fetching,
+parsing, TA-Lib, signals, backtests, charts). Everything is off by default:
+span() then hands back one shared no-op context and count() returns after a
+single flag check, so the hooks can stay in the hot paths.
+
+enable() (the --profile flag of app.py and backtest.py) switches them on and
+prints the per-stage breakdown when the process exits. With a path it also
+runs cProfile and writes path (pstats, for snakeviz and friends) and
+path.folded, the spans as folded stacks for flamegraph.pl / speedscope.
+
+Spans are collected in the process that enabled them; the render workers of
+batch mode report their own stage times through batch.Timings.
+"""
+import atexit
+import contextlib
+import cProfile
+import functools
+import threading
+import time
+from collections import defaultdict
+
+_enabled = False
+_lock = threading.Lock()
+# span name -> seconds / calls
+_seconds = defaultdict(float)
+_calls = defaultdict(int)
+# 'outer;inner' span stack -> seconds spent in it, children excluded
+_stacks = defaultdict(float)
+# counter name -> total
+_counters = defaultdict(int)
+_stack = threading.local()
+_profiler = None
+
+_NULL = contextlib.nullcontext()
+
+
+class Span:
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_stack, 'names', None)
+        if stack is None:
+            stack = _stack.names = []
+        stack.append([self.name, 0.0])
+        self.began = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        spent = time.perf_counter() - self.began
+        stack = _stack.names
+        _, children = stack.pop()
+        path = ';'.join([name for name, _ in stack] + [self.name])
+        with _lock:
+            _seconds[self.name] += spent
+            _calls[self.name] += 1
+            _stacks[path] += spent - children
+        if stack:
+            stack[-1][1] += spent
+        return False
+
+
+def span(name):
+    """ Context timing the block as stage name, a shared no-op while profiling is off """
+    if not _enabled:
+        return _NULL
+    return Span(name)
+
+
+def timed(name):
+    """ Decorator timing every call of the function as stage name """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with Span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, amount=1):
+    """ Adds amount to counter name """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] += amount
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        for table in (_seconds, _calls, _stacks, _counters):
+            table.clear()
+
+
+def enable(path=None, report=True):
+    """ Switches the spans and counters on; at exit prints report_text() and, with path, dumps cProfile + folded stacks """
+    global _enabled, _profiler
+    _enabled = True
+    if path:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(finish, path, report)
+
+
+def finish(path=None, report=True):
+    global _enabled, _profiler
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(path)
+        _profiler = None
+    if path:
+        write_folded(f'{path}.folded')
+    if report:
+        print(report_text())
+    _enabled = False
+
+
+def as_dict():
+    with _lock:
+        return {'spans': {name: {'calls': _calls[name], 'seconds': seconds} for name, seconds in _seconds.items()},
+                'counters': dict(_counters)}
+
+
+def report_text():
+    """ Per-stage table (total seconds, including nested spans) followed by the counters """
+    lines = [f'{"stage":<24}{"calls":>8}{"seconds":>12}{"ms/call":>10}']
+    with _lock:
+        for name, seconds in sorted(_seconds.items(), key=lambda item: -item[1]):
+            lines.append(f'{name:<24}{_calls[name]:>8}{seconds:>12.3f}{seconds / _calls[name] * 1000:>10.2f}')
+        for name, total in _counters.items():
+            lines.append(f'{name:<24}{total:>8}')
+    return '\n'.join(lines)
+
+
+def write_folded(path):
+    """ Span stacks as 'outer;inner microseconds' lines, the input flamegraph.pl and speedscope take """
+    with _lock, open(path, 'w') as f:
+        for stack, seconds in _stacks.items():
+            f.write(f'{stack} {max(int(seconds * 1e6), 0)}\n')
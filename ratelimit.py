@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Request-weight budget shared by every thread talking to the Binance API
+"""
+import threading
+import time
+
+# Default REQUEST_WEIGHT limit per minute of the public API
+WEIGHT_PER_MINUTE = 1200
+
+
+def kline_weight(limit=500):
+    """ Request weight of one klines call, which grows with the page size """
+    if limit <= 100:
+        return 1
+    if limit <= 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+class RateLimiter:
+    """ Token bucket refilled continuously at weight_per_minute / 60 tokens a second """
+
+    def __init__(self, weight_per_minute=WEIGHT_PER_MINUTE):
+        self.capacity = weight_per_minute
+        self.rate = weight_per_minute / 60.0
+        self.tokens = float(weight_per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, weight=1):
+        """ Blocks until weight tokens are available and takes them """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = (weight - self.tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Indicator and strategy registry
+
+An indicator names a TA-Lib function together with its inputs, parameters
+and output names. Inputs are kline columns ('close') or another indicator's
+output ('MACD.macd'), so indicators form a dependency graph. A strategy
+names the indicators it needs and turns their outputs into an int8
+BUY/SELL signal array.
+
+compute() resolves the graph for whatever a set of strategies needs and runs
+each indicator once per dataset (through an indicator_cache.IndicatorCache,
+so repeated datasets are not recomputed either). New strategies are added
+with the @strategy decorator:
+
+    @strategy('RSI', '6040', requires=['RSI'], value='RSI.rsi')
+    def rsi_6040(values, state=None):
+        return threshold_signals(values['RSI.rsi'], 40, 60, state)
+
+state is None for a whole series; chunked.py passes one dict per series so
+the strategy can carry its position from chunk to chunk.
+"""
+from indicator_cache import default_cache
+from signals import crossover_signals, threshold_signals
+
+# key -> Indicator
+INDICATORS = {}
+# (indicator, strategy name) -> Rule
+STRATEGIES = {}
+
+
+class Indicator:
+
+    def __init__(self, key, function, inputs, outputs, labels=None, **params):
+        self.key = key
+        #TA-Lib function name
+        self.function = function
+        #Kline columns or 'KEY.output' references
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        #Legend label of each output
+        self.labels = tuple(labels or (f'{key} {output}' for output in outputs))
+        self.params = params
+
+    def dependencies(self):
+        return [ref.partition('.')[0] for ref in self.inputs if '.' in ref]
+
+    def refs(self):
+        return [f'{self.key}.{output}' for output in self.outputs]
+
+
+class Rule:
+
+    def __init__(self, indicator, name, requires, signals, value):
+        #Indicator family the strategy belongs to, e.g. 'RSI'
+        self.indicator = indicator
+        self.name = name
+        #Indicator keys it needs
+        self.requires = tuple(requires)
+        #(values dict, state dict or None) -> int8 signal array
+        self.signals = signals
+        #Output whose value is reported at each signal
+        self.value = value
+
+
+def register_indicator(key, function, inputs, outputs, labels=None, **params):
+    INDICATORS[key] = Indicator(key, function, inputs, outputs, labels, **params)
+    return INDICATORS[key]
+
+
+def strategy(indicator, name, requires, value):
+    """ Decorator registering a (values, state=None) -> signals function as a strategy """
+    def register(signals):
+        STRATEGIES[(indicator, name)] = Rule(indicator, name, requires, signals, value)
+        return signals
+    return register
+
+
+def get_strategy(indicator, name):
+    try:
+        return STRATEGIES[(indicator, name)]
+    except KeyError:
+        raise ValueError(f'Unknown strategy {indicator} {name}') from None
+
+
+def families():
+    """ Indicator families that have strategies, in registration order """
+    return list(dict.fromkeys(family for family, _ in STRATEGIES))
+
+
+def default_strategy(indicator):
+    """ Name of the first strategy registered for the indicator family """
+    for family, name in STRATEGIES:
+        if family == indicator:
+            return name
+    raise ValueError(f'No strategies for {indicator}')
+
+
+def dependencies(keys):
+    """ Every indicator keys depend on, each once, dependencies first """
+    order = []
+    visiting = set()
+
+    def visit(key):
+        if key in order:
+            return
+        if key in visiting:
+            raise ValueError(f'Indicator {key} depends on itself')
+        if key not in INDICATORS:
+            raise ValueError(f'Unknown indicator {key}')
+        visiting.add(key)
+        for dependency in INDICATORS[key].dependencies():
+            visit(dependency)
+        visiting.discard(key)
+        order.append(key)
+
+    for key in keys:
+        visit(key)
+    return order
+
+
+def compute(klines, keys, cache=None, params=None):
+    """
+    Computes keys and their dependencies on a klines.Klines, returns
+    {'KEY.output': array}. params ({key: {param: value}}) overrides the
+    registered parameters of some indicators.
+    """
+    cache = cache if cache is not None else default_cache
+    params = params or {}
+    values = {}
+    for key in dependencies(keys):
+        indicator = INDICATORS[key]
+        columns = [ref for ref in indicator.inputs if '.' not in ref]
+        if len(columns) == len(indicator.inputs):
+            inputs = [klines[ref] for ref in columns]
+            fp = klines.fingerprint(*columns)
+        else:
+            inputs = [values[ref] if '.' in ref else klines[ref] for ref in indicator.inputs]
+            fp = None
+        outputs = cache.indicator(indicator.function, inputs, fp=fp, **{**indicator.params, **params.get(key, {})})
+        values.update(zip(indicator.refs(), outputs))
+    return values
+
+
+def run_strategies(klines, rules, cache=None, params=None):
+    """ Signals of every Rule, sharing the indicators they have in common; returns (signals, values) """
+    values = compute(klines, [key for rule in rules for key in rule.requires], cache, params)
+    return [rule.signals(values) for rule in rules], values
+
+
+register_indicator('MACD', 'MACD', ['close'], ['macd', 'macdsignal', 'macdhist'],
+                   labels=['MACD', 'MACD Signal', 'MACD Histogram'], fastperiod=12, slowperiod=26, signalperiod=9)
+register_indicator('RSI', 'RSI', ['close'], ['rsi'], labels=['RSI'], timeperiod=14)
+register_indicator('STOCH', 'STOCH', ['high', 'low', 'close'], ['slowk', 'slowd'],
+                   labels=['STOCH Slowk', 'STOCH Slowd'])
+register_indicator('SAR', 'SAR', ['high', 'low'], ['sar'], labels=['Parabolic SAR'], acceleration=0.05, maximum=0.2)
+register_indicator('BBANDS', 'BBANDS', ['close'], ['upperband', 'middleband', 'lowerband'],
+                   labels=['UPPERBAND Signal', 'MIDDLEBAND Signal', 'LOWERBAND Histogram'],
+                   timeperiod=5, nbdevup=2, nbdevdn=2, matype=0)
+register_indicator('SMA_14', 'SMA', ['close'], ['sma'], labels=['SMA 14'], timeperiod=14)
+register_indicator('SMA_200', 'SMA', ['close'], ['sma'], labels=['SMA 200'], timeperiod=200)
+
+
+@strategy('MACD', 'CROSS', requires=['MACD'], value='MACD.macd')
+def macd_cross(values, state=None):
+    #BUY when the MACD crosses above its signal line, SELL when it crosses back below
+    return crossover_signals(values['MACD.macd'], values['MACD.macdsignal'], state)
+
+
+#The first strategy of a family is its default
+@strategy('RSI', '8020', requires=['RSI'], value='RSI.rsi')
+def rsi_8020(values, state=None):
+    #BUY when the RSI drops under 20, SELL once it rises over 80
+    return threshold_signals(values['RSI.rsi'], 20, 80, state)
+
+
+@strategy('RSI', '7030', requires=['RSI'], value='RSI.rsi')
+def rsi_7030(values, state=None):
+    return threshold_signals(values['RSI.rsi'], 30, 70, state)
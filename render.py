@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Headless chart rendering
+
+Chart draws on its own Figure/Axes with the Agg canvas, so nothing touches
+pyplot's global state and charts can be rendered in parallel worker
+processes. It offers the subset of the pyplot API TaGenerator uses, and
+series longer than the chart is wide are reduced to their min/max per pixel
+column before they reach matplotlib.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Explicit version of TaGenerator.rc_params
+DARK = {
+    'figure': 'black',
+    'axes': 'black',
+    'edge': 'lightgray',
+    'text': 'white',
+    'grid': 'grey',
+}
+
+
+def downsample(x, y, buckets):
+    """
+    Keeps the min and max of y in each of `buckets` equal slices, both placed
+    at the slice's first x. At one slice per pixel column the line looks the
+    same as the full series. NaN-only slices stay NaN so warm-up gaps survive.
+    """
+    edges = np.unique(np.linspace(0, len(y), buckets + 1).astype(np.int64)[:-1])
+    with np.errstate(invalid='ignore'):
+        low = np.fmin.reduceat(y, edges)
+        high = np.fmax.reduceat(y, edges)
+    return np.repeat(x[edges], 2), np.column_stack((low, high)).ravel()
+
+
+class Chart:
+
+    def __init__(self, width=2500, height=1200, dpi=100, style=DARK):
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+        self.style = style
+        self.figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi, facecolor=style['figure'],
+                             edgecolor=style['figure'])
+        FigureCanvasAgg(self.figure)
+        self.reset()
+
+    def reset(self):
+        self.figure.clear()
+        self.axes = self.figure.add_subplot()
+        self.axes.set_facecolor(self.style['axes'])
+        for spine in self.axes.spines.values():
+            spine.set_color(self.style['edge'])
+        self.axes.tick_params(colors=self.style['text'])
+
+    def plot(self, x, y, *fmt, **kwargs):
+        if len(y) > 2 * self.width:
+            x, y = downsample(np.asarray(x), np.asarray(y), self.width)
+        return self.axes.plot(x, y, *fmt, **kwargs)
+
+    def scatter(self, x, y, **kwargs):
+        return self.axes.scatter(x, y, **kwargs)
+
+    def title(self, text):
+        self.axes.set_title(text, color=self.style['text'])
+
+    def xlabel(self, text):
+        self.axes.set_xlabel(text, color=self.style['text'])
+
+    def ylabel(self, text):
+        self.axes.set_ylabel(text, color=self.style['text'])
+
+    def grid(self):
+        self.axes.grid(color=self.style['grid'])
+
+    def legend(self):
+        # A fixed location, 'best' scans every point of every line
+        self.axes.legend(loc='upper left', facecolor=self.style['axes'], edgecolor=self.style['edge'],
+                         labelcolor=self.style['text'])
+
+    def savefig(self, filename):
+        self.figure.savefig(filename, facecolor=self.figure.get_facecolor())
+
+    def close(self, *args):
+        self.reset()
+
+
+def render_job(job):
+    """
+    Worker: renders one (symbol, interval, indicators, outdir, store root,
+    start, end) job from the kline store, returns the written paths and the
+    seconds spent loading, computing indicators and rendering.
+    """
+    from app import GENERATORS, TaGenerator
+    from klinestore import KlineStore
+    symbol, interval, indicators, outdir, root, start, end = job
+    timings = {'load': 0.0, 'indicator': 0.0, 'render': 0.0}
+    began = time.perf_counter()
+    tagen = TaGenerator(symbol, interval, store=KlineStore(root), offline=True, start=start, end=end,
+                        headless=True)
+    timings['load'] += time.perf_counter() - began
+    written = []
+    for indicator in indicators:
+        began = time.perf_counter()
+        p = getattr(tagen, GENERATORS[indicator])()
+        timings['indicator'] += time.perf_counter() - began
+        began = time.perf_counter()
+        filename = os.path.join(outdir, f'{symbol}_{interval}_{indicator}.png')
+        tagen.save(p, filename)
+        p.close()
+        timings['render'] += time.perf_counter() - began
+        written.append(filename)
+    return written, timings
+
+
+def render_many(jobs, processes=None):
+    """ Renders jobs on a process pool, yielding each job's result or the exception it raised """
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as pool:
+        futures = [pool.submit(render_job, job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                yield job, future.result()
+            except Exception as err:
+                yield job, err
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Higher timeframes from stored 1m candles
+
+resample() aggregates kline columns into any longer interval in a handful of
+NumPy reduceat calls: open of the first candle, close of the last, highest
+high, lowest low, and the sums of the volumes and trade counts. Buckets are
+aligned the way Binance aligns them: to multiples of the interval since the
+epoch, except 1w, which starts on Monday 00:00 UTC.
+
+Resampler does the same incrementally for candles arriving in order: the
+base candles of the bucket still forming are kept and folded in again with
+the next batch. app.py --live --resample builds every interval from one 1m
+stream per symbol this way (streaming.Resampling). resample_store() tops up a stored interval from the stored
+1m candles, only looking at the candles since its last stored bar, so one 1m
+update keeps every timeframe current and consistent with the others.
+"""
+import numpy as np
+
+from klinestore import COLUMNS, empty_columns, interval_ms
+
+BASE = '1m'
+
+# Epoch offset of the bucket boundaries, where they are not multiples of the interval
+OFFSET_MS = {
+    # 1970-01-01 was a Thursday, the first Monday is 4 days later
+    '1w': 4 * 24 * 60 * 60 * 1000,
+}
+
+# Columns summed over the bucket
+SUMMED = ('volume', 'quote_volume', 'trades', 'taker_base_volume', 'taker_quote_volume')
+
+
+def bucket_start(open_time, interval):
+    """ open_time of the interval bar each open_time falls into """
+    step = interval_ms(interval)
+    offset = OFFSET_MS.get(interval, 0)
+    return (open_time - offset) // step * step + offset
+
+
+def resample(columns, interval, base=BASE, partial_first=False):
+    """
+    Aggregates sorted base candles into interval bars. The last bar may still
+    be forming. The first bar is dropped when the candles start after its
+    open unless partial_first is set, since it would miss part of its range.
+    """
+    if interval_ms(interval) % interval_ms(base):
+        raise ValueError(f'{interval} is not a multiple of {base}')
+    open_time = columns['open_time']
+    if not len(open_time):
+        return empty_columns()
+    buckets = bucket_start(open_time, interval)
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+    if not partial_first and open_time[0] != buckets[0]:
+        starts = starts[1:]
+        if not len(starts):
+            return empty_columns()
+        columns = {name: column[starts[0]:] for name, column in columns.items()}
+        buckets = buckets[starts[0]:]
+        starts = starts - starts[0]
+    ends = np.append(starts[1:], len(buckets)) - 1
+
+    bars = {
+        'open_time': buckets[starts],
+        'open': columns['open'][starts],
+        'high': np.maximum.reduceat(columns['high'], starts),
+        'low': np.minimum.reduceat(columns['low'], starts),
+        'close': columns['close'][ends],
+        'close_time': buckets[starts] + interval_ms(interval) - 1,
+    }
+    for name in SUMMED:
+        bars[name] = np.add.reduceat(columns[name], starts)
+    return {name: np.ascontiguousarray(bars[name], dtype=dtype) for name, dtype in COLUMNS}
+
+
+class Resampler:
+    """ Incremental resample() for batches of base candles arriving in order """
+
+    def __init__(self, interval, base=BASE):
+        self.interval = interval
+        self.base = base
+        #Base candles of the bar still forming
+        self.pending = None
+        self.started = False
+
+    def update(self, columns):
+        """ Adds base candles, returns the bars they complete or change; the last one may still be forming """
+        if self.pending is not None:
+            #A candle sent again (it was still open the first time) replaces the pending one
+            first = columns['open_time'][:1]
+            keep = int(np.searchsorted(self.pending['open_time'], first[0])) if len(first) else None
+            columns = {name: np.concatenate((self.pending[name][:keep], columns[name])) for name, _ in COLUMNS}
+        if not len(columns['open_time']):
+            return empty_columns()
+        #Only the very first bar can be partial, later ones start with the pending candles
+        bars = resample(columns, self.interval, self.base, partial_first=self.started)
+        if len(bars['open_time']):
+            self.started = True
+            first = np.searchsorted(columns['open_time'], bars['open_time'][-1])
+            self.pending = {name: column[first:] for name, column in columns.items()}
+        else:
+            self.pending = columns
+        return bars
+
+
+def update_resampled(store, loader, symbol, intervals, start=None, end=None, base=BASE):
+    """ Fetches only symbol's base candles (without a loader: uses the stored ones) and resamples every interval """
+    if loader is not None:
+        store.update(loader, symbol, base, start=start, end=end)
+    for interval in intervals:
+        if interval != base:
+            resample_store(store, symbol, interval, base)
+
+
+def resample_store(store, symbol, interval, base=BASE):
+    """
+    Writes the interval bars of the stored base candles into the store,
+    starting from the last stored interval bar (which may have been forming).
+    A bar whose first base candle is not stored is left alone. Returns the
+    number of bars written.
+    """
+    last = store.last_open_time(symbol, interval)
+    bars = resample(store.load(symbol, base, start=last), interval, base)
+    store.merge(symbol, interval, bars)
+    return len(bars['open_time'])
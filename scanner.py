@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Cross-sectional market scanner
+
+The last `bars` candles of every symbol are aligned on one common open_time
+index as (N x T) matrices, one row per symbol. Windowed indicators (SMA,
+BBANDS) are computed for all rows at once from cumulative sums along the
+time axis; recursive ones (MACD, RSI, ...) run TA-Lib row by row on a thread
+pool, in parallel since TA-Lib releases the GIL. Every registry strategy is
+then evaluated per row and the latest state of each symbol is collected into
+one table that can be ranked, e.g. by the freshest MACD cross or the lowest
+RSI.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import talib as ta
+
+from klines import FIELDS
+from registry import INDICATORS, STRATEGIES, dependencies
+from signals import BUY
+
+# Candles kept per symbol: the default get_klines page, enough for SMA_200
+BARS = 500
+
+
+def stored_symbols(store, symbols, interval):
+    """ Offline batch.resolve_symbols: a quote asset such as USDT expands to the stored pairs quoted in it """
+    resolved = []
+    for symbol in symbols:
+        if symbol.upper() in ('USDT', 'BUSD', 'BTC', 'ETH', 'BNB'):
+            stored = sorted(os.listdir(store.root)) if os.path.isdir(store.root) else []
+            resolved.extend(name for name in stored if name.endswith(symbol.upper()) and name != symbol.upper()
+                            and os.path.isdir(store.path(name, interval)))
+        else:
+            resolved.append(symbol.upper())
+    return list(dict.fromkeys(resolved))
+
+
+def forward_fill(matrix):
+    """ NaNs replaced by the last defined value of their row; leading NaNs stay """
+    latest = np.where(np.isnan(matrix), -1, np.arange(matrix.shape[1]))
+    np.maximum.accumulate(latest, axis=1, out=latest)
+    filled = np.take_along_axis(matrix, np.maximum(latest, 0), axis=1)
+    filled[latest < 0] = np.nan
+    return filled
+
+
+def align(store, symbols, interval, bars=BARS, end=None):
+    """
+    Aligns the last bars candles of every stored symbol on the union of their
+    open_times. Returns (symbols, open_time, {field: (N x T) matrix}, stale);
+    symbols without stored candles are dropped. Bars a symbol has no candle
+    for are NaN before its first candle and flat candles of zero volume after
+    it. stale counts, per row, the bars after its last real candle, which are
+    forward-filled and say nothing about the symbol now.
+    """
+    loaded = {}
+    for symbol in symbols:
+        columns = store.load(symbol, interval, end=end, names=[name for name, _ in FIELDS])
+        if not len(columns['open_time']):
+            print(f'Warning: no stored klines for {symbol} {interval}')
+            continue
+        loaded[symbol] = {name: columns[name][-bars:] for name, _ in FIELDS}
+    if not loaded:
+        raise ValueError(f'No stored klines for any symbol at {interval}')
+    open_time = np.unique(np.concatenate([columns['open_time'] for columns in loaded.values()]))[-bars:]
+
+    matrices = {name: np.full((len(loaded), len(open_time)), np.nan) for name, _ in FIELDS[1:]}
+    last = np.array([columns['open_time'][-1] for columns in loaded.values()])
+    stale = len(open_time) - np.searchsorted(open_time, last, side='right')
+    for row, columns in enumerate(loaded.values()):
+        keep = columns['open_time'] >= open_time[0]
+        at = np.searchsorted(open_time, columns['open_time'][keep])
+        for name in matrices:
+            matrices[name][row, at] = columns[name][keep]
+    close = forward_fill(matrices['close'])
+    for name in ('open', 'high', 'low'):
+        matrices[name] = np.where(np.isnan(matrices[name]), close, matrices[name])
+    matrices['close'] = close
+    matrices['volume'] = np.where(np.isnan(matrices['volume']) & ~np.isnan(close), 0.0, matrices['volume'])
+    return list(loaded), open_time, matrices, stale
+
+
+def rolling_mean(matrix, period):
+    """ Mean of the last period values of every row, NaN until period defined values are in the window """
+    sums = np.cumsum(np.nan_to_num(matrix), axis=1)
+    counts = np.cumsum(~np.isnan(matrix), axis=1)
+    sums[:, period:] -= sums[:, :-period].copy()
+    counts[:, period:] -= counts[:, :-period].copy()
+    with np.errstate(invalid='ignore'):
+        return np.where(counts == period, sums / period, np.nan)
+
+
+def sma(close, timeperiod=30):
+    return (rolling_mean(close, timeperiod),)
+
+
+def bbands(close, timeperiod=5, nbdevup=2, nbdevdn=2, matype=0):
+    """ TA-Lib BBANDS with the simple moving average (matype 0) and population deviation """
+    if matype != 0:
+        raise ValueError('Only matype=0 is vectorized')
+    #Centred per row so the sum of squares does not cancel out at high prices
+    with np.errstate(invalid='ignore'):
+        centre = np.nan_to_num(np.nanmean(close, axis=1, keepdims=True))
+    shifted = close - centre
+    mean = rolling_mean(shifted, timeperiod)
+    deviation = np.sqrt(np.maximum(rolling_mean(shifted * shifted, timeperiod) - mean * mean, 0))
+    middle = mean + centre
+    return middle + nbdevup * deviation, middle, middle - nbdevdn * deviation
+
+
+# TA-Lib function -> 2D version working on all rows at once
+VECTORIZED = {
+    'SMA': sma,
+    'BBANDS': bbands,
+}
+
+
+def rowwise(function, inputs, params, pool):
+    """ A TA-Lib function over every row of the input matrices, returns one matrix per output """
+    calculate = getattr(ta, function)
+
+    def row(index):
+        outputs = calculate(*(np.ascontiguousarray(matrix[index]) for matrix in inputs), **params)
+        return outputs if isinstance(outputs, tuple) else (outputs,)
+
+    rows = list(pool.map(row, range(len(inputs[0]))))
+    return tuple(np.vstack(output) for output in zip(*rows))
+
+
+def compute(matrices, keys, threads=None):
+    """ registry.compute for (N x T) matrices: keys and their dependencies, as {'KEY.output': matrix} """
+    values = {}
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for key in dependencies(keys):
+            indicator = INDICATORS[key]
+            inputs = [values[ref] if '.' in ref else matrices[ref] for ref in indicator.inputs]
+            if indicator.function in VECTORIZED:
+                outputs = VECTORIZED[indicator.function](*inputs, **indicator.params)
+            else:
+                outputs = rowwise(indicator.function, inputs, indicator.params, pool)
+            values.update(zip(indicator.refs(), outputs))
+    return values
+
+
+def latest_signals(signals):
+    """ Side (BUY/SELL, 0 for none) and age in bars of the last signal of every row """
+    fired = signals != 0
+    age = np.argmax(fired[:, ::-1], axis=1)
+    side = signals[np.arange(len(signals)), signals.shape[1] - 1 - age]
+    return np.where(fired.any(axis=1), side, 0), np.where(fired.any(axis=1), age, -1)
+
+
+def scan(store, symbols, interval, rules=None, keys=None, bars=BARS, end=None, threads=None):
+    """
+    Latest state of every symbol as a DataFrame: close, the last value of
+    every indicator output and, per strategy, the side and age of its last
+    signal (columns 'MACD_CROSS' and 'MACD_CROSS_age'). stale_bars is the
+    number of forward-filled bars since the symbol's last real candle. rules
+    default to every registered strategy, keys to every registered indicator.
+    """
+    rules = list(STRATEGIES.values()) if rules is None else rules
+    keys = list(INDICATORS) if keys is None else keys
+    symbols, open_time, matrices, stale = align(store, symbols, interval, bars, end)
+    values = compute(matrices, list(keys) + [key for rule in rules for key in rule.requires], threads)
+
+    table = {'symbol': symbols, 'close': matrices['close'][:, -1], 'stale_bars': stale}
+    table.update((ref, matrix[:, -1]) for ref, matrix in values.items())
+    for rule in rules:
+        signals = np.vstack([rule.signals({ref: values[ref][row] for ref in values}) for row in range(len(symbols))])
+        side, age = latest_signals(signals)
+        table[f'{rule.indicator}_{rule.name}'] = side
+        table[f'{rule.indicator}_{rule.name}_age'] = age
+    table = pd.DataFrame(table)
+    table.attrs['time'] = int(open_time[-1])
+    return table
+
+
+def rank(table, by, stale=False):
+    """
+    Sorts the scan table by a strategy column (fresh BUYs first, then older
+    BUYs, SELLs last) or by any value column, ascending (e.g. 'RSI.rsi').
+    Symbols without a candle at the latest bar are left out unless stale.
+    """
+    if not stale:
+        table = table[table['stale_bars'] == 0]
+    if f'{by}_age' in table:
+        buy = table[by] == BUY
+        age = table[f'{by}_age'].where(table[by] != 0, np.iinfo(np.int64).max)
+        order = np.lexsort((age.to_numpy(), ~buy.to_numpy()))
+        return table.iloc[order].reset_index(drop=True)
+    if by not in table:
+        raise ValueError(f'Unknown column {by}')
+    return table.sort_values(by, na_position='last').reset_index(drop=True)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Long-running analysis service
+
+A small HTTP/JSON API over warm in-memory klines and the indicator cache, so
+bots pay Python start-up and imports once instead of on every call. Klines
+of each (symbol, interval) are loaded once and topped up from the API when
+they are older than `refresh` seconds; indicators go through one shared
+IndicatorCache. Plotting is only imported when a chart is requested.
+
+    GET /indicators?symbol=BTCUSDT&interval=1h&keys=MACD,RSI&bars=10
+    GET /signals?symbol=BTCUSDT&interval=1h&indicator=RSI&strategy=7030&bars=500
+    GET /backtest?symbol=BTCUSDT&interval=1h&indicator=MACD&strategy=CROSS&fee=0.1&stop_loss=2
+    GET /chart?symbol=BTCUSDT&interval=1h&indicator=MACD        (PNG)
+    GET /health
+
+Times are epoch milliseconds, NaN is sent as null and errors come back as
+{"error": message} with status 400. Fee, slippage, size and stop parameters
+are percentages with the defaults of the backtest.py command line (0.1%
+Binance spot fees).
+"""
+import io
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from engine import Costs, positions, run_backtest
+from indicator_cache import IndicatorCache
+from klines import Klines
+from klinestore import periods_per_year
+from registry import INDICATORS, compute, get_strategy
+from resample import BASE, update_resampled
+from signals import BUY
+
+
+def to_list(array):
+    """ JSON-ready list of an array, NaN as None """
+    return [None if value != value else value for value in np.asarray(array).tolist()]
+
+
+class Service:
+
+    def __init__(self, store, loader=None, cache=None, refresh=10.0, resample=False):
+        self.store = store
+        #history.HistoryLoader for top-ups, None to serve the store as it is
+        self.loader = loader
+        self.cache = cache if cache is not None else IndicatorCache()
+        #Seconds before a dataset is topped up again
+        self.refresh = refresh
+        #Fetch 1m candles only and resample the interval from them
+        self.resample = resample
+        #(symbol, interval) -> (Klines, monotonic time loaded)
+        self.datasets = {}
+        #Reentrant: a resampled pair also takes the lock of its 1m pair, which may be itself
+        self.locks = defaultdict(threading.RLock)
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+
+    def lock_of(self, key):
+        with self.lock:
+            return self.locks[key]
+
+    def klines(self, symbol, interval):
+        """ Warm Klines of the pair, topped up first when older than refresh """
+        key = (symbol.upper(), interval)
+        #One caller refreshes a pair, the others wait for it instead of fetching too
+        with self.lock_of(key):
+            dataset = self.datasets.get(key)
+            if dataset is None or (self.loader is not None and time.monotonic() - dataset[1] > self.refresh):
+                if self.resample:
+                    #Every interval of the symbol is built from, and tops up, the same 1m files
+                    with self.lock_of((key[0], BASE)):
+                        update_resampled(self.store, self.loader, key[0], [interval])
+                elif self.loader is not None:
+                    self.store.update(self.loader, *key)
+                klines = Klines.from_columns(self.store.load(*key, mmap=False))
+                if not len(klines):
+                    raise ValueError(f'No klines for {key[0]} {interval}')
+                dataset = self.datasets[key] = (klines, time.monotonic())
+        return dataset[0]
+
+    def warm(self, pairs):
+        """ Loads every (symbol, interval) and computes every indicator on it """
+        for symbol, interval in pairs:
+            compute(self.klines(symbol, interval), list(INDICATORS), self.cache)
+
+    def indicators(self, symbol, interval, keys=('MACD', 'RSI'), bars=1):
+        klines = self.klines(symbol, interval)
+        values = compute(klines, keys, self.cache)
+        refs = [ref for key in keys for ref in INDICATORS[key].refs()]
+        return {'symbol': symbol.upper(), 'interval': interval, 'open_time': to_list(klines.open_time[-bars:]),
+                'values': {ref: to_list(values[ref][-bars:]) for ref in refs}}
+
+    def signals(self, symbol, interval, indicator, strategy, bars=500):
+        """ Signals of the last bars candles and whether the strategy is long at the last one """
+        klines = self.klines(symbol, interval)
+        rule = get_strategy(indicator, strategy)
+        values = compute(klines, rule.requires, self.cache)
+        signals = rule.signals(values)
+        first = max(len(klines) - bars, 0)
+        fired = first + np.flatnonzero(signals[first:])
+        return {'symbol': symbol.upper(), 'interval': interval, 'indicator': indicator, 'strategy': strategy,
+                'open_time': int(klines.open_time[-1]), 'long': bool(positions(signals)[-1]),
+                'signals': [{'open_time': int(klines.open_time[i]), 'side': 'BUY' if signals[i] == BUY else 'SELL',
+                             'price': float(klines.close[i]), 'value': float(values[rule.value][i])}
+                            for i in fired]}
+
+    def backtest(self, symbol, interval, indicator, strategy, starting_amount=100000, start=None, end=None,
+                 fee=0.1, maker_fee=None, slippage=0.0, slippage_model='fixed', size=100.0, stop_loss=None,
+                 take_profit=None):
+        """ engine.run_backtest of the strategy over candles with open_time in [start, end] """
+        klines = self.klines(symbol, interval)
+        rule = get_strategy(indicator, strategy)
+        signals = rule.signals(compute(klines, rule.requires, self.cache))
+        first = 0 if start is None else int(np.searchsorted(klines.open_time, start))
+        stop = None if end is None else int(np.searchsorted(klines.open_time, end, side='right'))
+        costs = Costs(fee / 100, (fee if maker_fee is None else maker_fee) / 100, slippage / 100, slippage_model)
+        result = run_backtest(signals, klines.close, starting_amount, first, stop, high=klines.high, low=klines.low,
+                              open_=klines.open, costs=costs, size=size / 100,
+                              stop_loss=stop_loss / 100 if stop_loss else None,
+                              take_profit=take_profit / 100 if take_profit else None,
+                              periods_per_year=periods_per_year(interval))
+        trades = [dict(zip(result.trades.dtype.names, trade)) for trade in result.trades.tolist()]
+        for trade in trades:
+            trade['entry'] = int(klines.open_time[trade['entry']])
+            trade['exit'] = int(klines.open_time[trade['exit']])
+        return {'symbol': symbol.upper(), 'interval': interval, 'indicator': indicator, 'strategy': strategy,
+                'amount': result.amount, 'percent': result.percent, 'trades': result.num_trades,
+                'win_rate': result.win_rate, 'fees': result.fees, 'max_drawdown': result.max_drawdown,
+                'sharpe': result.sharpe, 'exposure': result.exposure, 'open_position': result.open_position,
+                'open_price': result.open_price, 'fills': trades}
+
+    def chart(self, symbol, interval, indicator):
+        """ PNG of app.py's chart for indicator, drawn from the warm klines """
+        #Plotting (matplotlib) is only imported by the first chart request
+        from app import GENERATORS, TaGenerator
+        if indicator not in GENERATORS:
+            raise ValueError(f'Unknown indicator {indicator}, choose from {", ".join(GENERATORS)}')
+        klines = self.klines(symbol, interval)
+        tagen = TaGenerator(symbol.upper(), interval, klines=klines, headless=True, cache=self.cache)
+        buffer = io.BytesIO()
+        tagen.save(getattr(tagen, GENERATORS[indicator])(), buffer)
+        return buffer.getvalue()
+
+    def health(self):
+        return {'uptime': time.time() - self.started, 'requests': self.requests,
+                'datasets': [f'{symbol} {interval}' for symbol, interval in self.datasets],
+                'cache': {'hits': self.cache.hits, 'misses': self.cache.misses, 'extended': self.cache.extended}}
+
+
+def number(params, name, default=None, kind=float):
+    """ Query parameter name converted with kind, default when missing """
+    if name not in params:
+        return default
+    try:
+        return kind(params[name])
+    except ValueError:
+        raise ValueError(f'Bad value for {name}: {params[name]}') from None
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Keep-alive, bots reuse their connection
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes, Nagle would hold the body back for the client's delayed ACK
+    disable_nagle_algorithm = True
+    service = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, payload, status=200):
+        self.send_body(json.dumps(payload).encode(), 'application/json', status)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        service = self.service
+        service.requests += 1
+        try:
+            if url.path == '/health':
+                self.send_json(service.health())
+                return
+            symbol = params.get('symbol', 'BTCUSDT')
+            interval = params.get('interval', '1h')
+            if url.path == '/indicators':
+                keys = params.get('keys', 'MACD,RSI').split(',')
+                for key in keys:
+                    if key not in INDICATORS:
+                        raise ValueError(f'Unknown indicator {key}')
+                self.send_json(service.indicators(symbol, interval, keys, number(params, 'bars', 1, int)))
+            elif url.path == '/signals':
+                self.send_json(service.signals(symbol, interval, params.get('indicator', 'MACD'),
+                                               params.get('strategy', 'CROSS'), number(params, 'bars', 500, int)))
+            elif url.path == '/backtest':
+                self.send_json(service.backtest(
+                    symbol, interval, params.get('indicator', 'MACD'), params.get('strategy', 'CROSS'),
+                    starting_amount=number(params, 'starting_amount', 100000), start=number(params, 'start', None, int),
+                    end=number(params, 'end', None, int), fee=number(params, 'fee', 0.1),
+                    maker_fee=number(params, 'maker_fee'), slippage=number(params, 'slippage', 0.0),
+                    slippage_model=params.get('slippage_model', 'fixed'), size=number(params, 'size', 100.0),
+                    stop_loss=number(params, 'stop_loss'), take_profit=number(params, 'take_profit')))
+            elif url.path == '/chart':
+                self.send_body(service.chart(symbol, interval, params.get('indicator', 'MACD')), 'image/png')
+            else:
+                self.send_json({'error': f'Unknown path {url.path}'}, status=404)
+        except ValueError as err:
+            self.send_json({'error': str(err)}, status=400)
+        except Exception as err:
+            self.send_json({'error': f'{type(err).__name__}: {err}'}, status=500)
+
+
+def serve(service, host='127.0.0.1', port=8080):
+    """ ThreadingHTTPServer answering for service; call serve_forever() on it """
+    Handler.service = service
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
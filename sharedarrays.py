@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+NumPy arrays shared with a process pool
+
+share() copies named arrays into one SharedMemory block before the pool
+starts, and attach(), run as the pool initializer, maps them back into each
+worker as views. Tasks then only pickle a few parameters and read their
+arrays from `views`.
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Per-worker views into the shared block, keyed by the names given to share()
+views = {}
+_block = None
+
+
+def share(arrays):
+    """ Copies {name: array} into one SharedMemory block, returns it and the (name, dtype, shape, offset) layout """
+    layout = []
+    offset = 0
+    for name, array in arrays.items():
+        layout.append((name, array.dtype.str, array.shape, offset))
+        offset += -(-array.nbytes // 8) * 8
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for (name, dtype, shape, start), array in zip(layout, arrays.values()):
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=start)[...] = array
+    return block, layout
+
+
+def attach(name, layout):
+    """ Pool initializer: maps the shared arrays into this worker """
+    global _block
+    _block = shared_memory.SharedMemory(name=name)
+    for key, dtype, shape, offset in layout:
+        views[key] = np.ndarray(shape, dtype=dtype, buffer=_block.buf, offset=offset)
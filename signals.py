@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Vectorized signal engine
+
+Signals are int8 arrays aligned with the klines: BUY (1) on the bar a
+position is opened, SELL (-1) on the bar it is closed, 0 everywhere else.
+"""
+import numpy as np
+
+BUY = 1
+SELL = -1
+
+
+def crossover_signals(fast, slow, state=None):
+    """
+    BUY where fast moves above slow, SELL where it drops back to or below it.
+    Bars where either input is NaN are skipped and do not reset the state, and
+    the first defined bar with fast above slow counts as a cross.
+
+    state, when given, is a dict carrying the position across consecutive
+    chunks of one series (see chunked.py); pass the same dict every call.
+    """
+    signals = np.zeros(len(fast), dtype=np.int8)
+    valid = np.flatnonzero(~(np.isnan(fast) | np.isnan(slow)))
+    above = (fast[valid] > slow[valid]).astype(np.int8)
+    before = state.get('above', 0) if state is not None else 0
+    signals[valid] = np.diff(above, prepend=np.int8(before))
+    if state is not None and len(valid):
+        state['above'] = above[-1]
+    return signals
+
+
+def threshold_signals(values, lower, upper, state=None):
+    """
+    Stateful threshold strategy: BUY the first time values drop below lower
+    while flat, SELL the first time they rise above upper while long.
+
+    Every bar below lower / above upper is an event asking to be long / flat;
+    forward-filling the latest event gives the desired state at every bar and
+    its changes are the fills, all without a Python loop. state carries the
+    position across chunks like in crossover_signals.
+    """
+    if lower >= upper:
+        raise ValueError(f'lower threshold {lower} must be below upper threshold {upper}')
+    events = np.zeros(len(values), dtype=np.int8)
+    events[values < lower] = 1
+    events[values > upper] = -1
+    latest = np.where(events != 0, np.arange(len(values)), -1)
+    np.maximum.accumulate(latest, out=latest)
+    before = state.get('long', False) if state is not None else False
+    long = np.where(latest >= 0, events[latest] == 1, before)
+    if state is not None and len(long):
+        state['long'] = bool(long[-1])
+    return np.diff(long.astype(np.int8), prepend=np.int8(before))
@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Incremental indicators fed by kline stream updates
+
+Every indicator keeps O(1) state per update instead of recomputing the whole
+history: EMA-based MACD, Wilder RSI, running-sum SMA/BBANDS, STOCH over
+monotonic deques and Wilder's parabolic SAR. Seeding and warm-up follow TA-Lib
+so the streamed values line up with the batch ones. An IndicatorEngine drives one
+set of them per (symbol, interval) from closed candles and reports MACD
+crosses and RSI threshold signals as they happen.
+
+Updates come either from Binance's kline websocket (LiveStream) or from the
+local kline store replayed in the same message format (ReplayStream).
+Resampling builds the longer intervals from one 1m stream per symbol.
+"""
+import math
+import time
+from collections import deque
+
+import numpy as np
+
+from klines import Klines
+from klinestore import COLUMNS
+from resample import BASE, Resampler, bucket_start
+from signals import BUY, SELL
+
+NAN = float('nan')
+
+
+class EMA:
+    """ Seeded with the SMA of the first period values, like TA-Lib """
+
+    def __init__(self, period):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.seed = []
+        self.value = NAN
+
+    def update(self, x):
+        if self.seed is not None:
+            self.seed.append(x)
+            if len(self.seed) == self.period:
+                self.value = sum(self.seed) / self.period
+                self.seed = None
+            return self.value
+        self.value += self.k * (x - self.value)
+        return self.value
+
+
+class SMA:
+    """ Running sum over a fixed window """
+
+    def __init__(self, period):
+        self.period = period
+        self.window = deque()
+        self.total = 0.0
+        self.value = NAN
+
+    def update(self, x):
+        self.window.append(x)
+        self.total += x
+        if len(self.window) > self.period:
+            self.total -= self.window.popleft()
+        if len(self.window) == self.period:
+            self.value = self.total / self.period
+        return self.value
+
+
+class BBands:
+    """ SMA +/- nbdev population standard deviations, from running sums of x and x**2 """
+
+    def __init__(self, period=5, nbdevup=2, nbdevdn=2):
+        self.period = period
+        self.nbdevup = nbdevup
+        self.nbdevdn = nbdevdn
+        self.window = deque()
+        self.total = 0.0
+        self.squares = 0.0
+        self.value = (NAN, NAN, NAN)
+
+    def update(self, x):
+        self.window.append(x)
+        self.total += x
+        self.squares += x * x
+        if len(self.window) > self.period:
+            old = self.window.popleft()
+            self.total -= old
+            self.squares -= old * old
+        if len(self.window) == self.period:
+            mean = self.total / self.period
+            # Running sums can cancel to a tiny negative variance on flat prices
+            std = math.sqrt(max(self.squares / self.period - mean * mean, 0.0))
+            self.value = (mean + self.nbdevup * std, mean, mean - self.nbdevdn * std)
+        return self.value
+
+
+class MACD:
+    """
+    fast EMA - slow EMA, with an EMA of that as the signal line. As in TA-Lib
+    the fast EMA skips the first slow - fast values so both EMAs are seeded on
+    the same bar, and nothing is reported until the signal line is defined.
+    """
+
+    def __init__(self, fastperiod=12, slowperiod=26, signalperiod=9):
+        # TA-Lib quietly swaps the periods when given the wrong way round
+        fastperiod, slowperiod = sorted((fastperiod, slowperiod))
+        self.skip = slowperiod - fastperiod
+        self.fast = EMA(fastperiod)
+        self.slow = EMA(slowperiod)
+        self.signal = EMA(signalperiod)
+        self.value = (NAN, NAN, NAN)
+
+    def update(self, x):
+        slow = self.slow.update(x)
+        if self.skip:
+            self.skip -= 1
+            return self.value
+        fast = self.fast.update(x)
+        if math.isnan(slow):
+            return self.value
+        macd = fast - slow
+        signal = self.signal.update(macd)
+        if not math.isnan(signal):
+            self.value = (macd, signal, macd - signal)
+        return self.value
+
+
+class RSI:
+    """ Wilder's RSI, averages seeded with the mean of the first period moves """
+
+    def __init__(self, period=14):
+        self.period = period
+        self.previous = None
+        self.gains = 0.0
+        self.losses = 0.0
+        self.count = 0
+        self.value = NAN
+
+    def update(self, x):
+        if self.previous is None:
+            self.previous = x
+            return self.value
+        change = x - self.previous
+        self.previous = x
+        gain = max(change, 0.0)
+        loss = max(-change, 0.0)
+        if self.count < self.period:
+            self.gains += gain
+            self.losses += loss
+            self.count += 1
+            if self.count < self.period:
+                return self.value
+            self.gains /= self.period
+            self.losses /= self.period
+        else:
+            self.gains = (self.gains * (self.period - 1) + gain) / self.period
+            self.losses = (self.losses * (self.period - 1) + loss) / self.period
+        total = self.gains + self.losses
+        self.value = 100.0 * self.gains / total if total else 0.0
+        return self.value
+
+
+class Stoch:
+    """ Slow stochastic; the window high/low come from monotonic deques in amortised O(1) """
+
+    def __init__(self, fastk_period=5, slowk_period=3, slowd_period=3):
+        self.fastk_period = fastk_period
+        self.highs = deque()
+        self.lows = deque()
+        self.index = 0
+        self.slowk = SMA(slowk_period)
+        self.slowd = SMA(slowd_period)
+        self.value = (NAN, NAN)
+
+    def update(self, high, low, close):
+        i = self.index
+        self.index += 1
+        while self.highs and self.highs[-1][1] <= high:
+            self.highs.pop()
+        self.highs.append((i, high))
+        while self.lows and self.lows[-1][1] >= low:
+            self.lows.pop()
+        self.lows.append((i, low))
+        oldest = i - self.fastk_period + 1
+        while self.highs[0][0] < oldest:
+            self.highs.popleft()
+        while self.lows[0][0] < oldest:
+            self.lows.popleft()
+        if oldest < 0:
+            return self.value
+        highest = self.highs[0][1]
+        lowest = self.lows[0][1]
+        fastk = 100.0 * (close - lowest) / (highest - lowest) if highest > lowest else 0.0
+        slowk = self.slowk.update(fastk)
+        if not math.isnan(slowk):
+            slowd = self.slowd.update(slowk)
+            # Like TA-Lib, nothing is reported until slowd is defined too
+            if not math.isnan(slowd):
+                self.value = (slowk, slowd)
+        return self.value
+
+
+class SAR:
+    """ Wilder's parabolic SAR, following TA-Lib's start-up and clamping rules """
+
+    def __init__(self, acceleration=0.02, maximum=0.2):
+        self.acceleration = acceleration
+        self.maximum = maximum
+        self.previous = None
+        self.long = None
+        self.sar = NAN
+        self.ep = NAN
+        self.af = acceleration
+        self.value = NAN
+
+    def update(self, high, low):
+        if self.previous is None:
+            self.previous = (high, low)
+            return self.value
+        if self.long is None:
+            # Start short only when the first bar's down move beats its up move
+            prev_high, prev_low = self.previous
+            down = prev_low - low
+            self.long = not (down > 0 and down > high - prev_high)
+            self.sar, self.ep = (prev_low, high) if self.long else (prev_high, low)
+            # TA-Lib clamps the first output against the bar itself
+            prev_high, prev_low = high, low
+        else:
+            prev_high, prev_low = self.previous
+        self.previous = (high, low)
+
+        if self.long:
+            if low <= self.sar:
+                self.long = False
+                self.value = max(self.ep, prev_high, high)
+                self.af = self.acceleration
+                self.ep = low
+                self.sar = max(self.value + self.af * (self.ep - self.value), prev_high, high)
+                return self.value
+            self.value = self.sar
+            if high > self.ep:
+                self.ep = high
+                self.af = min(self.af + self.acceleration, self.maximum)
+            self.sar = min(self.sar + self.af * (self.ep - self.sar), prev_low, low)
+        else:
+            if high >= self.sar:
+                self.long = True
+                self.value = min(self.ep, prev_low, low)
+                self.af = self.acceleration
+                self.ep = high
+                self.sar = min(self.value + self.af * (self.ep - self.value), prev_low, low)
+                return self.value
+            self.value = self.sar
+            if low < self.ep:
+                self.ep = low
+                self.af = min(self.af + self.acceleration, self.maximum)
+            self.sar = max(self.sar + self.af * (self.ep - self.sar), prev_high, high)
+        return self.value
+
+
+class CrossDetector:
+    """ Streaming counterpart of signals.crossover_signals """
+
+    def __init__(self):
+        self.above = False
+
+    def update(self, fast, slow):
+        if math.isnan(fast) or math.isnan(slow):
+            return 0
+        above = fast > slow
+        signal = 0
+        if above != self.above:
+            signal = BUY if above else SELL
+        self.above = above
+        return signal
+
+
+class ThresholdDetector:
+    """ Streaming counterpart of signals.threshold_signals """
+
+    def __init__(self, lower, upper):
+        self.lower = lower
+        self.upper = upper
+        self.long = False
+
+    def update(self, value):
+        if value < self.lower and not self.long:
+            self.long = True
+            return BUY
+        if value > self.upper and self.long:
+            self.long = False
+            return SELL
+        return 0
+
+
+class IndicatorEngine:
+    """ Every indicator and signal of one (symbol, interval), updated once per closed candle """
+
+    def __init__(self, symbol, interval, macd=(12, 26, 9), rsi_period=14, lower=30, upper=70,
+                 sma_periods=(14, 200), bbands=(5, 2, 2), stoch=(5, 3, 3), sar=(0.05, 0.2)):
+        self.symbol = symbol
+        self.interval = interval
+        self.macd = MACD(*macd)
+        self.rsi = RSI(rsi_period)
+        self.smas = {period: SMA(period) for period in sma_periods}
+        self.bbands = BBands(*bbands)
+        self.stoch = Stoch(*stoch)
+        self.sar = SAR(*sar)
+        self.cross = CrossDetector()
+        self.threshold = ThresholdDetector(lower, upper)
+        self.last_open_time = None
+
+    def update(self, open_time, high, low, close):
+        """ Feeds one closed candle, returns its indicator values and any signals it triggered """
+        self.last_open_time = open_time
+        macd, macdsignal, macdhist = self.macd.update(close)
+        rsi = self.rsi.update(close)
+        upper, middle, lower = self.bbands.update(close)
+        slowk, slowd = self.stoch.update(high, low, close)
+        result = {
+            'symbol': self.symbol,
+            'interval': self.interval,
+            'open_time': open_time,
+            'close': close,
+            'macd': macd,
+            'macdsignal': macdsignal,
+            'macdhist': macdhist,
+            'rsi': rsi,
+            'bb_upper': upper,
+            'bb_middle': middle,
+            'bb_lower': lower,
+            'slowk': slowk,
+            'slowd': slowd,
+            'sar': self.sar.update(high, low),
+            'signals': [],
+        }
+        for period, sma in self.smas.items():
+            result[f'sma_{period}'] = sma.update(close)
+        side = self.cross.update(macd, macdsignal)
+        if side:
+            result['signals'].append(('MACD', side))
+        side = self.threshold.update(rsi)
+        if side:
+            result['signals'].append(('RSI', side))
+        return result
+
+    def warm_up(self, klines):
+        """ Runs stored history (a klines.Klines) through the indicators, discarding the output """
+        for values in zip(klines.open_time.tolist(), klines.high.tolist(), klines.low.tolist(),
+                          klines.close.tolist()):
+            self.update(*values)
+
+    def on_message(self, kline):
+        """ Handles the 'k' payload of a kline stream message; only closed, unseen candles count """
+        open_time = int(kline['t'])
+        if not kline['x'] or (self.last_open_time is not None and open_time <= self.last_open_time):
+            return None
+        return self.update(open_time, float(kline['h']), float(kline['l']), float(kline['c']))
+
+
+class Monitor:
+    """ Routes kline stream messages to one IndicatorEngine per (symbol, interval) """
+
+    def __init__(self, pairs, on_result, **params):
+        self.engines = {(symbol.upper(), interval): IndicatorEngine(symbol.upper(), interval, **params)
+                        for symbol, interval in pairs}
+        self.on_result = on_result
+
+    def warm_up(self, store, end=None):
+        """ Seeds every engine from the kline store, up to end when given """
+        for (symbol, interval), engine in self.engines.items():
+            engine.warm_up(Klines.from_columns(store.load(symbol, interval, end=end)))
+
+    def on_message(self, message):
+        # Combined streams wrap the event in {'stream': ..., 'data': ...}
+        event = message.get('data', message)
+        if event.get('e') != 'kline':
+            return
+        kline = event['k']
+        engine = self.engines.get((kline['s'], kline['i']))
+        if engine is None:
+            return
+        result = engine.on_message(kline)
+        if result is not None:
+            self.on_result(result)
+
+
+class Resampling:
+    """
+    Builds the pairs' intervals from their symbol's closed 1m candles with
+    resample.Resampler and passes every completed bar on as a closed kline
+    message, so only one 1m stream per symbol is needed. Messages of pairs
+    that want 1m itself are passed through.
+    """
+
+    # Kline payload field of each store column
+    FIELDS = {'open_time': 't', 'open': 'o', 'high': 'h', 'low': 'l', 'close': 'c', 'volume': 'v', 'close_time': 'T',
+              'quote_volume': 'q', 'trades': 'n', 'taker_base_volume': 'V', 'taker_quote_volume': 'Q'}
+
+    def __init__(self, pairs, callback, base=BASE):
+        self.base = base
+        self.callback = callback
+        self.symbols = sorted({symbol.upper() for symbol, _ in pairs})
+        self.passed = {(symbol.upper(), interval) for symbol, interval in pairs if interval == base}
+        self.resamplers = {(symbol.upper(), interval): Resampler(interval, base) for symbol, interval in pairs
+                           if interval != base}
+
+    def streams(self):
+        """ The (symbol, 1m) pairs to subscribe to """
+        return [(symbol, self.base) for symbol in self.symbols]
+
+    def seed(self, store, end=None):
+        """ Feeds the stored 1m candles of the bars still forming at end (default: the last stored candle) """
+        for (symbol, interval), resampler in self.resamplers.items():
+            open_time = store.load(symbol, self.base, end=end, names=['open_time'])['open_time']
+            if len(open_time):
+                resampler.update(store.load(symbol, self.base, mmap=False, end=end,
+                                            start=int(bucket_start(open_time[-1], interval))))
+
+    def on_message(self, message):
+        event = message.get('data', message)
+        if event.get('e') != 'kline':
+            return
+        kline = event['k']
+        symbol = kline['s']
+        if (symbol, kline['i']) in self.passed:
+            self.callback(message)
+        if kline['i'] != self.base or not kline['x']:
+            return
+        candle = {name: np.array([kline.get(self.FIELDS[name], 0)], dtype=dtype) for name, dtype in COLUMNS}
+        for (pair, interval), resampler in self.resamplers.items():
+            if pair != symbol:
+                continue
+            bars = resampler.update(candle)
+            #Bars the candle closes; the engine skips those it has already seen
+            for i in np.flatnonzero(bars['close_time'] <= candle['close_time'][0]):
+                self.callback(ReplayStream.message(symbol, interval, *[bars[name][i].item() for name in (
+                    'open_time', 'close_time', 'open', 'high', 'low', 'close', 'volume')], True))
+
+
+class ReplayStream:
+    """
+    Replays stored candles as kline stream messages, in open_time order across
+    all pairs. Each candle is preceded by `ticks` unclosed updates, like the
+    live stream sends while a candle forms.
+    """
+
+    def __init__(self, store, pairs, start=None, end=None, ticks=0, delay=0.0):
+        self.store = store
+        self.pairs = pairs
+        self.start = start
+        self.end = end
+        self.ticks = ticks
+        self.delay = delay
+
+    def messages(self):
+        candles = []
+        for symbol, interval in self.pairs:
+            columns = self.store.load(symbol.upper(), interval, start=self.start, end=self.end)
+            for values in zip(*[columns[name].tolist() for name in ('open_time', 'close_time', 'open', 'high',
+                                                                        'low', 'close', 'volume')]):
+                candles.append((values, symbol.upper(), interval))
+        candles.sort(key=lambda candle: candle[0][0])
+        for (open_time, close_time, open_, high, low, close, volume), symbol, interval in candles:
+            for tick in range(self.ticks):
+                # A partially formed candle heading from the open towards the close
+                part = open_ + (close - open_) * (tick + 1) / (self.ticks + 1)
+                yield self.message(symbol, interval, open_time, close_time, open_, max(open_, part),
+                                   min(open_, part), part, volume * (tick + 1) / (self.ticks + 1), False)
+            yield self.message(symbol, interval, open_time, close_time, open_, high, low, close, volume, True)
+
+    @staticmethod
+    def message(symbol, interval, open_time, close_time, open_, high, low, close, volume, closed):
+        return {'e': 'kline', 'E': close_time, 's': symbol, 'k': {
+            't': open_time, 'T': close_time, 's': symbol, 'i': interval, 'o': str(open_), 'h': str(high),
+            'l': str(low), 'c': str(close), 'v': str(volume), 'x': closed}}
+
+    def run(self, callback):
+        for message in self.messages():
+            callback(message)
+            if self.delay:
+                time.sleep(self.delay)
+
+
+class LiveStream:
+    """ Binance's combined kline websocket for every pair """
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+    def run(self, callback):
+        from binance import ThreadedWebsocketManager
+        manager = ThreadedWebsocketManager()
+        manager.start()
+        streams = [f'{symbol.lower()}@kline_{interval}' for symbol, interval in self.pairs]
+        manager.start_multiplex_socket(callback=callback, streams=streams)
+        manager.join()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Parameter sweep for the MACD cross and RSI threshold strategies
+
+MACD and RSI sweep their parameter ranges; any other registered indicator
+family runs each of its strategies with the registered parameters, so new
+strategies can be ranked next to them.
+
+The prices of every (symbol, interval) are packed into one shared-memory
+block before the process pool starts (sharedarrays.py); workers attach to it
+once and get NumPy views, so a task only pickles a few parameters. Each task
+computes one indicator configuration and backtests every threshold pair on
+it, and the results come back as one ranked table.
+"""
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from engine import run_backtest
+from klines import Klines
+from klinestore import periods_per_year
+from registry import STRATEGIES, compute, get_strategy
+from sharedarrays import attach, share, views
+from signals import threshold_signals
+
+# Kline columns shared with the workers
+COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+# Column order of the results table
+RESULT_COLUMNS = ['symbol', 'interval', 'indicator', 'strategy', 'fast', 'slow', 'signal', 'period', 'lower',
+                  'upper', 'amount', 'percent', 'trades', 'win_rate', 'fees', 'max_drawdown', 'sharpe']
+
+
+def parse_range(text):
+    """ '12' -> [12], '8,12,26' -> [8, 12, 26], '10:20:5' -> [10, 15, 20] (inclusive) """
+    if ':' in text:
+        parts = [float(part) for part in text.split(':')]
+        start, stop = parts[0], parts[1]
+        step = parts[2] if len(parts) > 2 else 1
+        values = np.arange(start, stop + step / 2, step)
+    else:
+        values = [float(part) for part in text.split(',')]
+    return [int(value) if float(value).is_integer() else float(value) for value in values]
+
+
+def dataset(key):
+    """ The shared prices of key as a Klines container for registry.compute """
+    return Klines({column: views[(key, column)] for column in COLUMNS})
+
+
+def backtest(key, klines, signals, starting_amount, costs, size):
+    #high/low are needed for range slippage
+    return run_backtest(signals, klines.close, starting_amount, high=klines.high, low=klines.low, costs=costs,
+                        size=size, periods_per_year=periods_per_year(key[1]))
+
+
+def macd_task(key, fast, slow, signal, starting_amount, costs=None, size=1.0):
+    klines = dataset(key)
+    rule = get_strategy('MACD', 'CROSS')
+    values = compute(klines, rule.requires, params={'MACD': {'fastperiod': fast, 'slowperiod': slow,
+                                                             'signalperiod': signal}})
+    result = backtest(key, klines, rule.signals(values), starting_amount, costs, size)
+    params = {'fast': fast, 'slow': slow, 'signal': signal}
+    return [row(key, 'MACD', 'CROSS', params, result)]
+
+
+def rsi_task(key, period, thresholds, starting_amount, costs=None, size=1.0):
+    klines = dataset(key)
+    rsi = compute(klines, ['RSI'], params={'RSI': {'timeperiod': period}})['RSI.rsi']
+    rows = []
+    for lower, upper in thresholds:
+        result = backtest(key, klines, threshold_signals(rsi, lower, upper), starting_amount, costs, size)
+        params = {'period': period, 'lower': lower, 'upper': upper}
+        #Named like the registered RSI strategies, upper first ('7030'), so -s can rerun it
+        rows.append(row(key, 'RSI', f'{upper}{lower}', params, result))
+    return rows
+
+
+def strategy_task(key, indicator, name, starting_amount, costs=None, size=1.0):
+    klines = dataset(key)
+    rule = get_strategy(indicator, name)
+    result = backtest(key, klines, rule.signals(compute(klines, rule.requires)), starting_amount, costs, size)
+    return [row(key, indicator, name, {}, result)]
+
+
+def row(key, indicator, strategy, params, result):
+    symbol, interval = key
+    return dict(symbol=symbol, interval=interval, indicator=indicator, strategy=strategy, **params,
+                amount=result.amount, percent=result.percent, trades=result.num_trades,
+                win_rate=result.win_rate, fees=result.fees, max_drawdown=result.max_drawdown,
+                sharpe=result.sharpe)
+
+
+def tasks(keys, indicators, fast, slow, signal, rsi_period, lower, upper, starting_amount, costs=None, size=1.0):
+    """ One task per dataset and indicator configuration """
+    thresholds = [(lo, hi) for lo, hi in itertools.product(lower, upper) if lo < hi]
+    for key in keys:
+        if 'MACD' in indicators:
+            for f, s, g in itertools.product(fast, slow, signal):
+                if f < s:
+                    yield macd_task, (key, f, s, g, starting_amount, costs, size)
+        if 'RSI' in indicators and thresholds:
+            for period in rsi_period:
+                yield rsi_task, (key, period, thresholds, starting_amount, costs, size)
+        for indicator, name in STRATEGIES:
+            if indicator in indicators and indicator not in ('MACD', 'RSI'):
+                yield strategy_task, (key, indicator, name, starting_amount, costs, size)
+
+
+def run_sweep(datasets, indicators=('MACD', 'RSI'), fast=(12,), slow=(26,), signal=(9,), rsi_period=(14,),
+              lower=(30,), upper=(70,), starting_amount=100000, processes=None, costs=None, size=1.0):
+    """
+    Runs the whole grid over {(symbol, interval): {column: array}} (the
+    COLUMNS) and returns the results ranked by ending amount. costs (an
+    engine.Costs) and size apply to every backtest; fills are at the close,
+    so no stops.
+    """
+    block, layout = share({(key, column): columns[column] for key, columns in datasets.items()
+                           for column in COLUMNS})
+    try:
+        with ProcessPoolExecutor(max_workers=processes or os.cpu_count(), initializer=attach,
+                                 initargs=(block.name, layout)) as pool:
+            futures = [pool.submit(func, *args) for func, args in
+                       tasks(datasets.keys(), indicators, fast, slow, signal, rsi_period, lower, upper,
+                             starting_amount, costs, size)]
+            rows = [entry for future in futures for entry in future.result()]
+    finally:
+        block.close()
+        block.unlink()
+    table = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    if len(table):
+        table = table.sort_values('amount', ascending=False, ignore_index=True)
+        table.insert(0, 'rank', np.arange(1, len(table) + 1))
+    return table
+
+
+def write_results(table, path):
+    """ Writes the ranked table as Parquet when the path ends in .parquet, CSV otherwise """
+    if path.endswith('.parquet'):
+        table.to_parquet(path, index=False)
+    else:
+        table.to_csv(path, index=False)
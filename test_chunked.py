@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+import numpy as np
+import pytest
+
+from chunked import ChunkedBacktest
+from engine import Costs, run_backtest
+from klines import Klines
+from signals import crossover_signals
+from test_engine import random_walk
+
+COUNT = 3000
+
+
+def split(open_, high, low, close, signals, size):
+    """ (klines, signals) chunks of at most size bars """
+    open_time = np.arange(len(close), dtype=np.int64) * 60_000
+    for first in range(0, len(close), size):
+        part = slice(first, first + size)
+        columns = {'open_time': open_time[part], 'open': open_[part], 'high': high[part], 'low': low[part],
+                   'close': close[part], 'volume': np.ones(len(close[part]))}
+        yield Klines(columns), signals[part]
+
+
+@pytest.mark.parametrize('size', [1, 7, 64, 1000])
+@pytest.mark.parametrize('options', [
+    {},
+    {'costs': Costs(taker=0.001, maker=0.0005, slippage=0.0002)},
+    {'costs': Costs(taker=0.001, slippage=0.1, model='range'), 'size': 0.5, 'stop_loss': 0.01},
+    {'costs': Costs(taker=0.001, maker=0.0002), 'stop_loss': 0.02, 'take_profit': 0.01},
+])
+def test_matches_run_backtest(size, options):
+    open_, high, low, close = random_walk(COUNT, seed=3)
+    fast = np.convolve(close, np.ones(5) / 5, 'same')
+    slow = np.convolve(close, np.ones(20) / 20, 'same')
+    signals = crossover_signals(fast, slow)
+    whole = run_backtest(signals, close, 100000, high=high, low=low, open_=open_, periods_per_year=365, **options)
+
+    backtest = ChunkedBacktest(100000, periods_per_year=365, **options)
+    trades = np.concatenate(list(backtest.run(split(open_, high, low, close, signals, size))))
+
+    assert backtest.amount == pytest.approx(whole.amount, rel=1e-9)
+    assert backtest.num_trades == whole.num_trades
+    assert backtest.profitable_trades == whole.profitable_trades
+    assert backtest.fees == pytest.approx(whole.fees, rel=1e-9)
+    assert backtest.open_position == whole.open_position
+    assert backtest.exposure == pytest.approx(whole.exposure)
+    assert backtest.max_drawdown == pytest.approx(whole.max_drawdown, rel=1e-9)
+    assert backtest.sharpe == pytest.approx(whole.sharpe, rel=1e-6)
+    assert np.array_equal(trades['entry'], whole.trades['entry'])
+    assert np.array_equal(trades['exit'], whole.trades['exit'])
+    assert np.array_equal(trades['reason'], whole.trades['reason'])
+    for field in ('entry_price', 'exit_price', 'quantity', 'fees', 'pnl'):
+        assert np.allclose(trades[field], whole.trades[field], rtol=1e-9), field
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+import numpy as np
+import pytest
+
+from engine import EXIT_SIGNAL, EXIT_STOP_LOSS, EXIT_TAKE_PROFIT, Costs, run_backtest
+from signals import BUY, SELL, crossover_signals
+
+
+def random_walk(count, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open_, close) * (1 + rng.random(count) * 0.01)
+    low = np.minimum(open_, close) * (1 - rng.random(count) * 0.01)
+    return open_, high, low, close
+
+
+def bars(*rows):
+    """ (open, high, low, close) arrays of the given rows """
+    return tuple(np.array(column, dtype=np.float64) for column in zip(*rows))
+
+
+def signal_array(length, **at):
+    signals = np.zeros(length, dtype=np.int8)
+    for side, indices in at.items():
+        signals[list(indices)] = BUY if side == 'buy' else SELL
+    return signals
+
+
+def old_loop(signals, close, starting_amount):
+    """ The timestamp-matching loop backtest.py ran before the engine, without its first and last bars """
+    amount = starting_amount
+    active_buy = False
+    buy_price = 0
+    trades = profitable = 0
+    for i in range(1, len(close) - 1):
+        if signals[i] == BUY:
+            active_buy = True
+            buy_price = close[i]
+        elif signals[i] == SELL and active_buy:
+            active_buy = False
+            trades += 1
+            profitable += close[i] > buy_price
+            amount = amount / buy_price * close[i]
+    return amount, trades, profitable
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_zero_cost_matches_old_loop(seed):
+    _, _, _, close = random_walk(2000, seed)
+    fast, slow = np.convolve(close, np.ones(5) / 5, 'same'), np.convolve(close, np.ones(20) / 20, 'same')
+    signals = crossover_signals(fast, slow)
+    result = run_backtest(signals, close, 100000, 1, len(close) - 1)
+    amount, trades, profitable = old_loop(signals, close, 100000)
+    assert result.amount == pytest.approx(amount, rel=1e-12)
+    assert result.num_trades == trades
+    assert result.profitable_trades == profitable
+
+
+def test_fees_and_fixed_slippage():
+    close = np.array([100.0, 100.0, 110.0, 110.0])
+    costs = Costs(taker=0.001, maker=0.0005, slippage=0.01)
+    result = run_backtest(signal_array(4, buy=[1], sell=[2]), close, 1000, costs=costs)
+    entry, exit_ = 100 * 1.01, 110 * 0.99
+    assert result.trades['entry_price'][0] == pytest.approx(entry)
+    assert result.trades['exit_price'][0] == pytest.approx(exit_)
+    assert result.amount == pytest.approx(1000 * exit_ * 0.999 / (entry * 1.001))
+    quantity = 1000 / (entry * 1.001)
+    assert result.fees == pytest.approx(quantity * (entry + exit_) * 0.001)
+    assert result.trades['pnl'][0] == pytest.approx(result.amount - 1000)
+
+
+def test_range_slippage():
+    open_, high, low, close = bars((100, 102, 98, 100), (100, 104, 96, 100), (100, 101, 99, 100))
+    costs = Costs(slippage=0.5, model='range')
+    result = run_backtest(signal_array(3, buy=[0], sell=[1]), close, 1000, high=high, low=low, costs=costs)
+    assert result.trades['entry_price'][0] == pytest.approx(100 + 0.5 * 4)
+    assert result.trades['exit_price'][0] == pytest.approx(100 - 0.5 * 8)
+
+
+def test_size_keeps_cash_aside():
+    close = np.array([100.0, 120.0, 120.0, 60.0])
+    result = run_backtest(signal_array(4, buy=[0, 2], sell=[1, 3]), close, 1000, size=0.5)
+    #+20% on half the cash, then -50% on half of that
+    assert result.amount == pytest.approx(1000 * 1.1 * 0.75)
+    assert result.equity.tolist() == pytest.approx([1000, 1100, 1100, 825])
+    with pytest.raises(ValueError):
+        run_backtest(signal_array(4), close, 1000, size=0)
+
+
+def test_stop_loss_gaps_through_the_open():
+    open_, high, low, close = bars((100, 101, 99, 100), (100, 101, 97, 99), (90, 92, 88, 91), (91, 92, 90, 91))
+    result = run_backtest(signal_array(4, buy=[0]), close, 1000, high=high, low=low, open_=open_, stop_loss=0.05)
+    trade = result.trades[0]
+    assert (trade['entry'], trade['exit'], trade['reason']) == (0, 2, EXIT_STOP_LOSS)
+    #Opened under the 95 stop, so it fills at the open rather than the stop
+    assert trade['exit_price'] == 90
+
+
+def test_take_profit_fills_at_target_or_gap_open_as_maker():
+    costs = Costs(taker=0.001, maker=0.0)
+    open_, high, low, close = bars((100, 100, 100, 100), (101, 111, 100, 105))
+    result = run_backtest(signal_array(2, buy=[0]), close, 1000, high=high, low=low, open_=open_, costs=costs,
+                          take_profit=0.1)
+    assert result.trades['reason'][0] == EXIT_TAKE_PROFIT
+    assert result.trades['exit_price'][0] == pytest.approx(110)
+    assert result.amount == pytest.approx(1000 * 110 / (100 * 1.001))
+
+    open_, high, low, close = bars((100, 100, 100, 100), (115, 116, 114, 115))
+    result = run_backtest(signal_array(2, buy=[0]), close, 1000, high=high, low=low, open_=open_, take_profit=0.1)
+    assert result.trades['exit_price'][0] == 115
+
+
+def test_bar_touching_both_levels_is_a_stop_unless_it_opened_beyond_target():
+    open_, high, low, close = bars((100, 100, 100, 100), (100, 112, 90, 100))
+    result = run_backtest(signal_array(2, buy=[0]), close, 1000, high=high, low=low, open_=open_, stop_loss=0.05,
+                          take_profit=0.1)
+    assert (result.trades['reason'][0], result.trades['exit_price'][0]) == (EXIT_STOP_LOSS, 95)
+
+    open_, high, low, close = bars((100, 100, 100, 100), (111, 112, 90, 100))
+    result = run_backtest(signal_array(2, buy=[0]), close, 1000, high=high, low=low, open_=open_, stop_loss=0.05,
+                          take_profit=0.1)
+    assert (result.trades['reason'][0], result.trades['exit_price'][0]) == (EXIT_TAKE_PROFIT, 111)
+
+
+def test_buy_on_the_stop_bar_reenters():
+    open_, high, low, close = bars((100, 100, 100, 100), (100, 100, 90, 96), (96, 97, 95, 96), (96, 99, 96, 98))
+    signals = signal_array(4, buy=[0, 1], sell=[3])
+    result = run_backtest(signals, close, 1000, high=high, low=low, open_=open_, stop_loss=0.05)
+    assert result.trades['entry'].tolist() == [0, 1]
+    assert result.trades['exit'].tolist() == [1, 3]
+    assert result.trades['reason'].tolist() == [EXIT_STOP_LOSS, EXIT_SIGNAL]
+    assert result.amount == pytest.approx(1000 * 0.95 * 98 / 96)
+
+
+def test_signal_exit_without_stop_hit():
+    open_, high, low, close = bars((100, 101, 99, 100), (100, 103, 98, 102), (102, 104, 101, 103))
+    result = run_backtest(signal_array(3, buy=[0], sell=[2]), close, 1000, high=high, low=low, open_=open_,
+                          stop_loss=0.05, take_profit=0.1)
+    assert (result.trades['exit'][0], result.trades['reason'][0]) == (2, EXIT_SIGNAL)
+    assert result.trades['exit_price'][0] == 103
+
+
+def test_window_ignores_sells_of_earlier_buys_and_counts_exposure_from_start():
+    close = np.linspace(100, 200, 1000)
+    signals = signal_array(1000, buy=[100, 800], sell=[600])
+    result = run_backtest(signals, close, 1000, start=500)
+    assert result.num_trades == 0
+    assert result.open_position
+    assert result.exposure == pytest.approx(200 / 500 * 100)
+    assert run_backtest(signals, close, 1000).exposure == pytest.approx((500 + 200) / 1000 * 100)
+
+
+def test_drawdown_and_sharpe():
+    close = np.array([100.0, 100.0, 120.0, 90.0, 90.0, 135.0])
+    result = run_backtest(signal_array(6, buy=[1], sell=[5]), close, 1000, periods_per_year=4)
+    assert result.equity.tolist() == pytest.approx([1000, 1000, 1200, 900, 900, 1350])
+    assert result.max_drawdown == pytest.approx(25)
+    returns = np.diff(result.equity) / result.equity[:-1]
+    assert result.sharpe == pytest.approx(returns.mean() / returns.std() * 2)
+    assert run_backtest(signal_array(6), close, 1000).sharpe == 0.0
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+import numpy as np
+
+from klinestore import KlineStore
+from scanner import rank, scan
+from test_service import START, minute_candles
+
+
+def test_stale_symbols_are_not_ranked(tmp_path):
+    store = KlineStore(str(tmp_path))
+    store.write('BTCUSDT', '1m', minute_candles(300))
+    #Delisted 20 minutes before the others' last candle
+    store.write('OLDUSDT', '1m', {name: column[:280] for name, column in minute_candles(300).items()})
+    table = scan(store, ['BTCUSDT', 'OLDUSDT'], '1m', keys=['RSI'], bars=100)
+    assert table.attrs['time'] == START + 299 * 60_000
+    assert table.set_index('symbol')['stale_bars'].to_dict() == {'BTCUSDT': 0, 'OLDUSDT': 20}
+    assert rank(table, 'RSI.rsi')['symbol'].tolist() == ['BTCUSDT']
+    assert rank(table, 'MACD_CROSS')['symbol'].tolist() == ['BTCUSDT']
+    assert sorted(rank(table, 'RSI.rsi', stale=True)['symbol']) == ['BTCUSDT', 'OLDUSDT']
+    assert np.isfinite(table['close']).all()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import json
+import threading
+import urllib.request
+
+import numpy as np
+
+from indicator_cache import IndicatorCache
+from klinestore import COLUMNS, KlineStore
+from service import Service, serve
+
+START = 1_600_000_000_000 // 3_600_000 * 3_600_000
+
+
+def minute_candles(count):
+    """ count 1m candles of a random walk, starting on an hour """
+    rng = np.random.default_rng(1)
+    close = 100 + np.cumsum(rng.normal(0, 0.1, count))
+    open_time = START + np.arange(count, dtype=np.int64) * 60_000
+    columns = {name: np.ones(count, dtype=dtype) for name, dtype in COLUMNS}
+    columns.update(open_time=open_time, close_time=open_time + 59_999, open=close, close=close,
+                   high=close + 0.05, low=close - 0.05)
+    return columns
+
+
+def test_resampled_indicators(tmp_path):
+    store = KlineStore(str(tmp_path))
+    store.write('BTCUSDT', '1m', minute_candles(60 * 100))
+    server = serve(Service(store, None, resample=True), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}/indicators?symbol=BTCUSDT&interval=1h&keys=RSI&bars=3'
+        with urllib.request.urlopen(url) as response:
+            payload = json.load(response)
+    finally:
+        server.shutdown()
+    assert payload['open_time'] == [START + hour * 3_600_000 for hour in (97, 98, 99)]
+    assert len(store.load('BTCUSDT', '1h')['open_time']) == 100
+    assert all(value is not None for value in payload['values']['RSI.rsi'])
+
+
+def test_threaded_cache(tmp_path):
+    cache = IndicatorCache(directory=str(tmp_path / 'cache'))
+    close = minute_candles(5000)['close']
+    barrier = threading.Barrier(8)
+    results = []
+
+    def worker():
+        barrier.wait()
+        for period in range(5, 25):
+            results.append(cache.indicator('SMA', [close], timeperiod=period)[0])
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 8 * 20
+    assert len(cache.entries) == 20
+    assert cache.nbytes == sum(output.nbytes for outputs in cache.entries.values() for output in outputs)
+    assert not [entry for path in (tmp_path / 'cache').iterdir() for entry in path.iterdir()
+                if entry.name.endswith('.tmp')]
+
+
+def test_threaded_requests(tmp_path):
+    store = KlineStore(str(tmp_path))
+    store.write('BTCUSDT', '1m', minute_candles(60 * 100))
+    service = Service(store, None, resample=True)
+    server = serve(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}/indicators?symbol=BTCUSDT&keys=MACD,RSI,SMA_14&bars=5'
+    payloads = []
+
+    def worker(interval):
+        with urllib.request.urlopen(f'{base}&interval={interval}') as response:
+            payloads.append((interval, json.load(response)))
+
+    try:
+        threads = [threading.Thread(target=worker, args=(interval,)) for interval in ('15m', '1h', '4h') * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.shutdown()
+    assert len(payloads) == 12
+    for interval, payload in payloads:
+        assert payload == service.indicators('BTCUSDT', interval, ['MACD', 'RSI', 'SMA_14'], 5)
+    cache = service.cache
+    assert cache.nbytes == sum(output.nbytes for outputs in cache.entries.values() for output in outputs)
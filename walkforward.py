@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Walk-forward backtesting
+
+The klines are cut into rolling windows of `train` candles followed by
+`test` candles. In each window every parameter configuration is backtested
+on the train slice, the best one (by ending amount or Sharpe ratio) is
+backtested on the test slice, and the test results chained together give
+the out-of-sample performance.
+
+Each configuration's indicator and signals are computed once over the whole
+series, so later windows see properly warmed-up indicators and nothing is
+recomputed per window. The signal matrix and the prices are put in shared
+memory once (sharedarrays.py); the windows run on a process pool and only
+slice views of it.
+"""
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from engine import run_backtest
+from registry import STRATEGIES, dependencies, get_strategy, run_strategies
+from sharedarrays import attach, share, views
+
+# Column order of the results table
+RESULT_COLUMNS = ['window', 'train_start', 'test_start', 'test_end', 'params', 'train_amount', 'train_sharpe',
+                  'amount', 'percent', 'trades', 'win_rate', 'fees', 'max_drawdown', 'sharpe']
+
+METRICS = ('amount', 'sharpe')
+
+
+def configs(indicator, grid=None):
+    """
+    Every registered strategy of the indicator family (see registry.py) with
+    every combination of the grid's indicator parameters, as flat dicts:
+    {'strategy': 'CROSS', 'MACD.fastperiod': 12, ...}. grid is
+    {key: {param: values}}; parameters it leaves out keep their registered
+    value. A fastperiod that is not below its slowperiod is skipped.
+    """
+    grid = grid or {}
+    rules = [rule for (family, _), rule in STRATEGIES.items() if family == indicator]
+    if not rules:
+        raise ValueError(f'Unknown indicator {indicator}')
+    found = []
+    for rule in rules:
+        axes = [(f'{key}.{param}', values) for key in dependencies(rule.requires)
+                for param, values in grid.get(key, {}).items()]
+        for combination in itertools.product(*(values for _, values in axes)):
+            config = dict(zip((name for name, _ in axes), combination))
+            if any(name.endswith('.fastperiod') and value >= config.get(name.replace('fast', 'slow'), np.inf)
+                   for name, value in config.items()):
+                continue
+            found.append({'strategy': rule.name, **config})
+    return found
+
+
+def overrides(config):
+    """ registry.compute params of a configuration: {key: {param: value}} """
+    params = {}
+    for name, value in config.items():
+        if name != 'strategy':
+            key, _, param = name.partition('.')
+            params.setdefault(key, {})[param] = value
+    return params
+
+
+def signal_matrix(klines, indicator, params, cache=None):
+    """ int8 signals of every configuration over the whole series, one row each """
+    matrix = np.zeros((len(params), len(klines)), dtype=np.int8)
+    #Strategies with the same indicator parameters share one computation
+    groups = {}
+    for row, config in enumerate(params):
+        key = tuple(sorted((name, value) for name, value in config.items() if name != 'strategy'))
+        groups.setdefault(key, []).append(row)
+    for rows in groups.values():
+        rules = [get_strategy(indicator, params[row]['strategy']) for row in rows]
+        signals, _ = run_strategies(klines, rules, cache, overrides(params[rows[0]]))
+        for row, array in zip(rows, signals):
+            matrix[row] = array
+    return matrix
+
+
+def windows(length, train, test, step=None):
+    """ (train start, test start, test end) of every full window, advancing by step (default: test) """
+    step = step or test
+    return [(start, start + train, start + train + test) for start in range(0, length - train - test + 1, step)]
+
+
+def window_task(window, bounds, metric, starting_amount, options):
+    """ Picks the best configuration on the train slice and backtests it on the test slice """
+    train_start, test_start, test_end = bounds
+    prices = {'high': views['high'], 'low': views['low'], 'open_': views['open']}
+    best, best_result = None, None
+    for row, signals in enumerate(views['signals']):
+        result = run_backtest(signals, views['close'], starting_amount, train_start, test_start, **prices,
+                              **options)
+        if best_result is None or getattr(result, metric) > getattr(best_result, metric):
+            best, best_result = row, result
+    result = run_backtest(views['signals'][best], views['close'], starting_amount, test_start, test_end,
+                          **prices, **options)
+    #Only the figures go back, not the equity curves
+    return dict(window=window, best=best, train_amount=best_result.amount, train_sharpe=best_result.sharpe,
+                amount=result.amount, percent=result.percent, trades=result.num_trades, win_rate=result.win_rate,
+                fees=result.fees, max_drawdown=result.max_drawdown, sharpe=result.sharpe)
+
+
+def run_walkforward(klines, indicator, params, train, test, step=None, metric='amount', starting_amount=100000,
+                    processes=None, **options):
+    """
+    Runs every window of the klines.Klines on a process pool and returns one
+    row per window. options (costs, size, stop_loss, take_profit,
+    periods_per_year) go to engine.run_backtest.
+    """
+    if metric not in METRICS:
+        raise ValueError(f'Unknown metric {metric}')
+    bounds = windows(len(klines), train, test, step)
+    if not bounds:
+        raise ValueError(f'{len(klines)} candles are not enough for one {train} + {test} candle window')
+    arrays = {'signals': signal_matrix(klines, indicator, params), 'close': klines.close, 'high': klines.high,
+              'low': klines.low, 'open': klines.open}
+    block, layout = share(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=processes or os.cpu_count(), initializer=attach,
+                                 initargs=(block.name, layout)) as pool:
+            futures = [pool.submit(window_task, window, window_bounds, metric, starting_amount, options)
+                       for window, window_bounds in enumerate(bounds)]
+            results = [future.result() for future in futures]
+    finally:
+        block.close()
+        block.unlink()
+
+    time = klines.time
+    for row in results:
+        train_start, test_start, test_end = bounds[row['window']]
+        row.update(train_start=time[train_start], test_start=time[test_start], test_end=time[test_end - 1],
+                   params=params[row.pop('best')])
+    return pd.DataFrame(results, columns=RESULT_COLUMNS)
+
+
+def chained_percent(table):
+    """ The test slices' growth compounded, in percent of the start; meaningful when step >= test """
+    return float(np.prod(table['percent'] / 100)) * 100